@@ -1,18 +1,26 @@
 import argparse
+import collections
+import contextlib
 import logging
+import math
+import os
+import shutil
 import sys
-
-import numpy as np
-import shapefile
+import time
 
 import shapeanalysis.database as database
+from shapeanalysis.cache import ClassificationCache
+from shapeanalysis.edges import PolygonIndex
+from shapeanalysis.incremental import GeometryDiff, parcel_stores, update_database
+from shapeanalysis.metrics import boxlike_rows
+from shapeanalysis.neighbors import REFERENCE_SETS, NeighborIndex, ReferenceCollector, shapefile_reference
+from shapeanalysis.pipeline import classify_matches, prefetch, sweep_chunks
 from shapeanalysis.process_data import (
-    split_list,
-    significant_points,
-    has_box,
-    centroid,
     nearest_distances,
 )
+from shapeanalysis.rings import CENTROIDS, ring_centroids
+from shapeanalysis.shapereader import GeometryReader
+from shapeanalysis.store import PolygonStore, pid_type, read_stores, select_records
 
 # Global logger instance
 logger = logging.getLogger()
@@ -29,66 +37,252 @@ def configure_logger():
     logger.addHandler(ch)
 
 
+def tolerance_list(value):
+    """Comma separated tolerances, such as 0.4,0.6,0.8"""
+    try:
+        return [float(item) for item in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid tolerance list: {value!r}')
+
+
 def parse_arguments(args):
     parser = argparse.ArgumentParser(description='Analyzes a tax parcel shapefile')
     parser.add_argument('shapefile', type=str, help='Path to the .shp file')
     parser.add_argument('output', type=str, help='Path to the output file')
     parser.add_argument('-i', '--inline-tolerance', type=float, default=0.6, help='Tolerance for determining insignificant point (feet): default=0.6')
     parser.add_argument('-a', '--angle-tolerance', type=float, default=0.03, help='Tolerance for measuring angles (radians): default=0.03')
-    return parser.parse_args(sys.argv[1:])
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of processes classifying rings: default=1')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Number of records read and classified together: default=1000')
+    parser.add_argument('--offset', type=int, default=0, help='Number of records to skip: default=0')
+    parser.add_argument('--limit', type=int, help='Maximum number of records to analyze: default=all')
+    parser.add_argument('--sample-fraction', type=float, help='Fraction of records to randomly sample: default=all')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for --sample-fraction: default=0')
+    parser.add_argument('--cache', type=str, help='Path to a cache of ring classifications to reuse: default=none')
+    parser.add_argument('--cache-size', type=int, default=1000000, help='Maximum number of rings kept in the cache: default=1000000')
+    parser.add_argument('--incremental', type=str, metavar='PREVIOUS', help='Database of a previous run to update with only the parcels that changed: default=none')
+    parser.add_argument('-k', '--num-nearest', type=int, default=2, help='Number of nearest distances measured for each match: default=2')
+    parser.add_argument('--reference', choices=REFERENCE_SETS, default='matched', help='Parcels the matches are measured against, the other matches or every parcel read: default=matched')
+    parser.add_argument('--reference-shapefile', type=str, help='Measure the matches against the features of this shapefile instead: default=none')
+    parser.add_argument('--distance', choices=('centroid', 'edge'), default='centroid', help='Measure between ring centroids or the nearest points of ring edges: default=centroid')
+    parser.add_argument('--centroid', choices=CENTROIDS, default='vertex', help='Centroid of a ring measured between, the mean of its simplified points or the centroid of its area: default=vertex')
+    parser.add_argument('--max-distance', type=float, default=math.inf, help='Distance beyond which neighbors are not searched for, leaving the distance infinite: default=none')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Number of rows written to the database at a time: default=10000')
+    parser.add_argument('--queue-size', type=int, default=4, help='Number of chunks waiting between the reading, classifying and writing stages: default=4')
+    parser.add_argument('--memory-budget', type=int, help='Megabytes the nearest distance query may use before it runs in tiles on disk: default=none')
+    parser.add_argument('--sweep', type=tolerance_list, nargs=2, metavar=('INLINE', 'ANGLE'), help='Comma separated inline and angle tolerances to write the matches of every combination of to a sweep table, instead of -i and -a: default=none')
+    parser.add_argument('--append', action='store_true', help='Add this run to the tables already in output instead of rebuilding them, so several runs can share one database')
+    parser.add_argument('--run', type=str, metavar='NAME', help='Name of the run, repeating a name replaces the rows of the run it names; with --incremental, the run to update: default=unnamed, or the latest run')
+    args = parser.parse_args(args)
+    if args.append and args.incremental:
+        parser.error('--append cannot be combined with --incremental, which updates a run in place')
+    if args.sweep and args.incremental:
+        parser.error('--sweep cannot be combined with --incremental')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+    if args.offset < 0:
+        parser.error('--offset cannot be negative')
+    if args.limit is not None and args.limit < 0:
+        parser.error('--limit cannot be negative')
+    if args.sample_fraction is not None and not 0 < args.sample_fraction <= 1:
+        parser.error('--sample-fraction must be greater than 0 and at most 1')
+    if args.num_nearest < 1:
+        parser.error('--num-nearest must be at least 1')
+    if args.incremental and (args.reference != 'matched' or args.reference_shapefile or args.distance != 'centroid'):
+        parser.error('--incremental only measures centroids of matches against each other')
+    if args.incremental and (args.offset or args.limit is not None or args.sample_fraction is not None):
+        parser.error('--incremental compares every record, it cannot be combined with --offset, --limit or --sample-fraction')
+    return args
+
+
+def run_parameters(args):
+    """Arguments recorded with a run in the runs table"""
+    return {name: value for name, value in vars(args).items() if name not in ('output', 'run')}
+
+
+def output_connection(args):
+    """Connection to the output database, set up for the mode of args
+
+    Bulk settings are only used when the whole output is rebuilt, not for a
+    sweep, which keeps the tables of other runs.
+    """
+    return database.connection(args.output, bulk=not (args.append or args.sweep), shared=args.append)
+
+
+@contextlib.contextmanager
+def run_writer(args, run):
+    """Writer to the output for run, committing as it goes when the output
+    is shared
+
+    Rows a shared run committed are deleted again if the run fails, so it
+    leaves no partial results behind.
+    """
+    try:
+        with database.Writer(lambda: output_connection(args), args.queue_size, args.append, args.batch_size) as writer:
+            yield writer
+    except BaseException:
+        if args.append:
+            with contextlib.closing(output_connection(args)) as conn, conn:
+                database.clear_run(conn, run)
+        raise
+
+
+def neighbor_distances(args, matches, centroid_points, ring_points, reference, memory_budget):
+    """Nearest distances of each match to the reference set chosen by args
+
+    Matches are measured against each other from centroid_points, the
+    centroids of their significant points, and against a reference set
+    from ring_points, the centroids of their rings as the reference set
+    has them.
+    """
+    if args.distance == 'edge':
+        if args.reference_shapefile:
+            index = PolygonIndex(PolygonStore.concatenate(read_stores(args.reference_shapefile, args.chunk_size)))
+            ids = None
+        elif args.reference == 'all':
+            index = PolygonIndex(PolygonStore.concatenate(reference.stores), reference.pids)
+            ids = matches.ring_pids
+        else:
+            index = PolygonIndex(matches, range(len(matches)))
+            ids = range(len(matches))
+        distances, _ = index.query(matches, args.num_nearest, ids, args.max_distance)
+    elif args.reference_shapefile:
+        _, reference_points = shapefile_reference(args.reference_shapefile, args.chunk_size, args.centroid)
+        index = NeighborIndex(reference_points)
+        distances, _ = index.query(ring_points, args.num_nearest, max_distance=args.max_distance)
+    elif args.reference == 'all':
+        index = NeighborIndex(reference.points, reference.pids)
+        distances, _ = index.query(ring_points, args.num_nearest, matches.ring_pids, args.max_distance)
+    else:
+        distances, _ = nearest_distances(
+            centroid_points,
+            args.num_nearest,
+            memory_budget=memory_budget,
+            max_distance=args.max_distance,
+        )
+    return distances
 
 
 def main():
     args = parse_arguments(sys.argv[1:])
     configure_logger()
+    started = time.time()
 
-    # Read in the given shapefile
-    logger.info('Reading file...')
-    sf = shapefile.Reader(args.shapefile)
-    shapeRecs = sf.shapeRecords()
-
-    # Process the shape records
+    # Stream the shapefile, only holding on to the rings that match
     logger.info('Processing...')
-    # Get individual shape points separated, as each shape can include multiple parts
-    point_list = [(points, rec) for rec in shapeRecs for points in split_list(rec.shape.points, rec.shape.parts)][:100]
-    total = len(point_list)
-    matches = []
-    for i, (points, rec) in enumerate(point_list):
-        logger.debug(f'Processing: {i}/{total}')
-        # Check if the shape matches the search criteria
-        sig_points = significant_points(points, args.inline_tolerance)
-        if has_box(points, args.inline_tolerance, args.angle_tolerance):
-            matches.append((rec, sig_points))
-
-    rec_data = []
-    centroid_points = []
-    for match_rec, points in matches:
-        centroid_point = centroid(points)
-        centroid_points.append(centroid_point)
-        rec_data.append([match_rec, centroid_point])
-
-    distances = nearest_distances(centroid_points, 2)
-
-    main = []
-    for i in range(len(rec_data)):
-        pid = rec_data[i][0].record[0]
-        near_dists = distances[rec_data[i][1].astype(np.float).tobytes()]
-        main.append((pid, near_dists[0], near_dists[1]))
-
-    # for _, c_point in rec_data:
-    #     rec_data
-    # for i in range(len(rec_data)):
-    #     rec_data[i] += list(distances[rec_data[i][1].astype(np.float).tobytes()])
-
-    # import csv
-    # with open('output.csv', 'w', newline='') as outputfile:
-    #     csv_writer = csv.writer(outputfile)
-    #     for x in rec_data:
-    #         csv_writer.writerow([x[0].record[0]] + [str(tuple(x[1]))] + x[2:])
-
-    with database.connection(args.output) as conn:
-        database.create_database(conn)
-        database.insert_main(conn, main)
+    records = select_records(
+        len(GeometryReader(args.shapefile)),
+        args.offset,
+        args.limit,
+        args.sample_fraction,
+        args.seed,
+    )
+    stores = read_stores(args.shapefile, args.chunk_size, records)
+
+    if args.sweep:
+        with contextlib.closing(output_connection(args)) as conn, conn:
+            database.create_sweep(conn, pid_type(args.shapefile), replace=not args.append)
+            run = database.start_run(conn, args.shapefile, run_parameters(args), args.run, started)
+        # Rows of each chunk are written while the next ones are read and swept
+        counts = collections.Counter()
+        with run_writer(args, run) as writer:
+            write_sweep = writer.stream(database.insert_sweep, args.batch_size, run)
+            for chunk in sweep_chunks(prefetch(stores, args.queue_size), *args.sweep, args.workers):
+                for (inline_tolerance, angle_tolerance), (matches, parts) in chunk.items():
+                    rows = [
+                        (inline_tolerance, angle_tolerance, pid, part, *point)
+                        for pid, part, point in zip(matches.ring_pids, parts.tolist(), ring_centroids(matches, args.centroid).tolist())
+                    ]
+                    counts[inline_tolerance, angle_tolerance] += len(rows)
+                    write_sweep(rows)
+            write_sweep(None)
+            writer.submit(database.finish_run, run, sum(counts.values()))
+        for (inline_tolerance, angle_tolerance), count in counts.items():
+            logger.info(f'Inline tolerance {inline_tolerance}, angle tolerance {angle_tolerance}: {count} matches')
+        return
+
+    # A previous run is updated in place in output
+    if args.incremental:
+        if os.path.abspath(args.incremental) != os.path.abspath(args.output):
+            shutil.copyfile(args.incremental, args.output)
+        with database.connection(args.output) as conn:
+            run = database.find_run(conn, args.run)
+            if run is None:
+                raise ValueError(f'{args.incremental} has no run to update')
+            parameters = database.select_run_parameters(conn, run)
+            if parameters.get('centroid', 'vertex') != args.centroid:
+                raise ValueError(f'The run in {args.incremental} measured a different centroid than {args.centroid}')
+            for name in ('inline_tolerance', 'angle_tolerance'):
+                if parameters.get(name) != getattr(args, name):
+                    raise ValueError(f'The run in {args.incremental} used {name} {parameters.get(name)}, not {getattr(args, name)}')
+            diff = GeometryDiff(database.select_parcels(conn, run))
+        stores = diff.changed_stores(stores)
+    else:
+        # Without --append the output is rebuilt, so it only holds this run
+        with contextlib.closing(output_connection(args)) as conn, conn:
+            database.create_database(conn, args.num_nearest, pid_type(args.shapefile), replace=not args.append)
+            run = database.start_run(conn, args.shapefile, run_parameters(args), args.run, started)
+
+    # The parcels of a full run are written as they are read, the
+    # rectangles as they are classified and the matches once the nearest
+    # distances are known
+    with (run_writer(args, run) if not args.incremental else contextlib.nullcontext()) as writer:
+        write_parcels = None
+        rectangles = []
+        write_rectangles = rectangles.extend
+        if writer is not None:
+            write_parcels = writer.stream(database.insert_parcels, args.batch_size, run)
+            stores = parcel_stores(stores, write_parcels)
+            write_rectangles = writer.stream(database.insert_rectangle, args.batch_size, run)
+        reference = ReferenceCollector(keep_stores=args.distance == 'edge', centroid=args.centroid)
+        if args.reference == 'all' and not args.reference_shapefile:
+            stores = reference.collect(stores)
+        stores = prefetch(stores, args.queue_size)
+
+        with (ClassificationCache(args.cache, args.cache_size) if args.cache else contextlib.nullcontext()) as cache:
+            matches, parts, windows, ring_points = classify_matches(
+                stores, args.inline_tolerance, args.angle_tolerance, args.workers, cache, args.centroid, write_rectangles
+            )
+        if write_parcels is not None:
+            write_parcels(None)
+            write_rectangles(None)
+
+        centroid_points = ring_centroids(matches, args.centroid)
+        memory_budget = args.memory_budget * 2 ** 20 if args.memory_budget else None
+        if args.incremental:
+            # Not bulk, a crash must not corrupt a previous run updated in place
+            with database.connection(args.output) as conn:
+                count = update_database(
+                    conn, diff, matches, parts, centroid_points, args.num_nearest, memory_budget, args.max_distance, run, windows, rectangles
+                )
+                database.finish_run(conn, run, count)
+            return
+
+        # Measured on the writer thread while the nearest distances are
+        # found, which need every match
+        writer.submit(database.insert_boxlike, boxlike_rows(matches, parts, windows), args.batch_size, run)
+        distances = neighbor_distances(args, matches, centroid_points, ring_points, reference, memory_budget)
+
+        main = (
+            (pid, part, *near_dists.tolist(), centroid_point[0], centroid_point[1])
+            for pid, part, centroid_point, near_dists in zip(matches.ring_pids, parts.tolist(), centroid_points, distances)
+        )
+
+        # for _, c_point in rec_data:
+        #     rec_data
+        # for i in range(len(rec_data)):
+        #     rec_data[i] += list(distances[rec_data[i][1].astype(np.float).tobytes()])
+
+        # import csv
+        # with open('output.csv', 'w', newline='') as outputfile:
+        #     csv_writer = csv.writer(outputfile)
+        #     for x in rec_data:
+        #         csv_writer.writerow([x[0].record[0]] + [str(tuple(x[1]))] + x[2:])
+
+        writer.submit(database.insert_main, main, args.num_nearest, args.batch_size, run)
+        writer.submit(database.create_indexes, None, run)
+        writer.submit(database.finish_run, run, len(matches))
 
 
 if __name__ == '__main__':
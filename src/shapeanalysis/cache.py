@@ -0,0 +1,119 @@
+import hashlib
+import sqlite3
+import struct
+
+import numpy as np
+
+from shapeanalysis.process_data import Classification
+
+# Keys per select, below SQLite's default limit on bound parameters
+LOOKUP_BATCH = 500
+
+# Version of what a result keeps, part of every key so entries cached by an
+# older version are never matched
+RESULT_VERSION = 2
+
+
+def ring_key(points, *params):
+    """Hash of a ring's coordinates and the classification parameters"""
+    digest = hashlib.sha1(np.ascontiguousarray(points, dtype=np.float64).tobytes())
+    digest.update(struct.pack(f'<{len(params) + 1}d', RESULT_VERSION, *params))
+    return digest.digest()
+
+
+class ClassificationCache:
+    """On-disk cache of classify_ring results, evicting least recently used
+
+    Only matching and four sided rings keep their significant points, the
+    same as the results classify_store returns.
+    """
+
+    def __init__(self, filename, max_entries=1000000):
+        self.conn = sqlite3.connect(filename)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn.execute("""
+            create table if not exists classification (
+                key blob primary key,
+                sig_points blob,
+                box_window integer,
+                rejected text,
+                used integer not null
+            )
+        """)
+        self.conn.execute("""create index if not exists classification_used on classification (used)""")
+        self.clock = self.conn.execute("""select coalesce(max(used), 0) from classification""").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, keys):
+        """Cached Classification for each key, None where missing"""
+        found = {}
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            rows = self.conn.execute(
+                f"""
+                select key, sig_points, box_window, rejected
+                from classification
+                where key in ({','.join('?' * len(batch))})
+                """,
+                batch,
+            )
+            for key, sig_points, window, rejected in rows:
+                if sig_points is not None:
+                    sig_points = np.frombuffer(sig_points, dtype=np.float64).reshape(-1, 2)
+                found[key] = Classification(sig_points, window is not None, window, rejected)
+
+        self.clock += 1
+        self.conn.executemany(
+            """update classification set used = ? where key = ?""",
+            ((self.clock, key) for key in found),
+        )
+        results = [found.get(key) for key in keys]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return results
+
+    def add(self, keys, results):
+        self.clock += 1
+        self.conn.executemany(
+            """
+            insert or replace into classification
+            (key, sig_points, box_window, rejected, used)
+            values (?, ?, ?, ?, ?)
+            """,
+            (
+                (
+                    key,
+                    None if result.sig_points is None else np.asarray(result.sig_points, dtype=np.float64).tobytes(),
+                    result.window,
+                    result.rejected,
+                    self.clock,
+                )
+                for key, result in zip(keys, results)
+            ),
+        )
+
+    def evict(self):
+        """Delete the least recently used entries over max_entries"""
+        count = self.conn.execute("""select count(*) from classification""").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                """
+                delete from classification where key in (
+                    select key from classification order by used limit ?
+                )
+                """,
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
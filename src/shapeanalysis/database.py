@@ -1,60 +1,561 @@
+import itertools
+import json
+import logging
+import queue
 import sqlite3
+import threading
+import time
 
+logger = logging.getLogger(__name__)
 
-def create_database(conn):
+# Rows passed to each executemany when streaming inserts
+BATCH_SIZE = 10000
+
+# Settings for loading a database that is rebuilt if a run fails: no
+# rollback journal on disk, no waiting on fsync, and a 256 MB page cache
+BULK_PRAGMAS = {
+    'journal_mode': 'memory',
+    'synchronous': 'off',
+    'temp_store': 'memory',
+    'cache_size': -256 * 1024,
+}
+
+# Settings for a database shared by several runs: a write-ahead log so
+# readers don't block the writer, and a long wait for the write lock
+SHARED_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'temp_store': 'memory',
+}
+SHARED_TIMEOUT = 600
+
+# Tables with rows tagged by run, cleared when a named run is repeated
+RUN_TABLES = ('main', 'rectangle', 'boxlike', 'sweep')
+
+
+def nearest_columns(num_nearest):
+    return [f'nearest{i}' for i in range(1, num_nearest + 1)]
+
+
+def upsert(table, columns, key):
+    """insert of columns into table, updating the other columns of a row
+    already there with the same key"""
+    updates = [column for column in columns if column not in key]
+    return f"""
+        insert into {table}
+        ({', '.join(columns)})
+        values ({', '.join('?' * len(columns))})
+        on conflict ({', '.join(key)}) do update
+        set {', '.join(f'{column} = excluded.{column}' for column in updates)}
+    """
+
+
+def create_runs(conn, replace=True):
+    c = conn.cursor()
+
+    # Table "runs", the parameters and timing of each run writing rows
+    if replace:
+        c.execute("""drop table if exists runs""")
+    c.execute("""
+        create table if not exists runs (
+            id integer primary key,
+            name text unique,
+            shapefile text not null,
+            parameters text not null,
+            started real not null,
+            finished real,
+            row_count integer
+        )
+    """)
+
+
+def start_run(conn, shapefile, parameters, name=None, started=None):
+    """Record a run and return its id
+
+    parameters is stored as JSON. Repeating a named run reuses its id and
+    clears the rows it wrote before, so the run is replaced rather than
+    added to.
+    """
+    c = conn.cursor()
+
+    started = time.time() if started is None else started
+    parameters = json.dumps(parameters, sort_keys=True)
+    row = c.execute("""select id from runs where name = ?""", (name,)).fetchone() if name is not None else None
+    if row is None:
+        c.execute(
+            """insert into runs (name, shapefile, parameters, started) values (?, ?, ?, ?)""",
+            (name, shapefile, parameters, started),
+        )
+        return c.lastrowid
+
+    run = row[0]
+    logger.info(f'Replacing the rows of run {name!r}')
+    clear_run(conn, run)
+    c.execute(
+        """
+        update runs set shapefile = ?, parameters = ?, started = ?, finished = null, row_count = null
+        where id = ?
+        """,
+        (shapefile, parameters, started, run),
+    )
+    return run
+
+
+def clear_run(conn, run):
+    """Delete the rows run wrote to every table, keeping its runs row"""
+    c = conn.cursor()
+
+    tables = {name for name, in c.execute("""select name from sqlite_master where type = 'table'""")}
+    if 'parcels' in tables:
+        c.execute("""delete from parcel_bbox where id in (select id from parcels where run = ?)""", (run,))
+        c.execute("""delete from parcels where run = ?""", (run,))
+    for table in RUN_TABLES:
+        if table in tables:
+            c.execute(f"""delete from {table} where run = ?""", (run,))
+
+
+def finish_run(conn, run, row_count):
+    """Record the end of run and the number of rows it wrote"""
+    c = conn.cursor()
+
+    c.execute("""update runs set finished = ?, row_count = ? where id = ?""", (time.time(), row_count, run))
+
+
+def find_run(conn, name=None):
+    """Id of the run called name, or of the latest run, None if there is none"""
+    c = conn.cursor()
+
+    if name is None:
+        row = c.execute("""select max(id) from runs""").fetchone()
+    else:
+        row = c.execute("""select id from runs where name = ?""", (name,)).fetchone()
+    return None if row is None else row[0]
+
+
+def select_run_parameters(conn, run):
+    """Parameters start_run recorded for run"""
     c = conn.cursor()
 
-    # Table "main"
-    c.execute("""drop table if exists main""")
-    c.execute("""create table main (pid, nearest1, nearest2)""")
+    row = c.execute("""select parameters from runs where id = ?""", (run,)).fetchone()
+    return json.loads(row[0])
+
+
+def create_database(conn, num_nearest=2, pid_type='integer', replace=True):
+    """Create the result tables, dropping them first if replace is set
+
+    replace drops the runs and the rows of every run, including any sweep.
+    Without it, tables already there are kept for another run to add rows
+    to, and main must already have num_nearest distance columns.
+    """
+    c = conn.cursor()
+
+    create_runs(conn, replace)
+    if replace:
+        c.execute("""drop table if exists sweep""")
+    if not replace and c.execute("""select 1 from sqlite_master where name = 'main'""").fetchone():
+        if main_nearest_count(conn) != num_nearest:
+            raise ValueError(f'The database holds a different number of nearest distances than {num_nearest}')
+
+    # Table "main", a row for each matching ring with a distance column
+    # for each nearest neighbor
+    if replace:
+        c.execute("""drop table if exists main""")
+    c.execute(f"""
+        create table if not exists main (
+            run integer not null,
+            pid {pid_type} not null,
+            part integer not null,
+            {' '.join(f'{column} real,' for column in nearest_columns(num_nearest))}
+            cx real not null,
+            cy real not null,
+            primary key (run, pid, part)
+        ) without rowid
+    """)
+
+    # Table "parcels", the geometry hash and bounding box of every record read
+    if replace:
+        c.execute("""drop table if exists parcel_bbox""")
+        c.execute("""drop table if exists parcels""")
+    c.execute(f"""
+        create table if not exists parcels (
+            id integer primary key,
+            run integer not null,
+            pid {pid_type} not null,
+            hash blob not null,
+            xmin real,
+            ymin real,
+            xmax real,
+            ymax real,
+            unique (run, pid)
+        )
+    """)
+    # R*Tree of the parcel bounding boxes, filled by create_indexes
+    c.execute("""create virtual table if not exists parcel_bbox using rtree(id, xmin, xmax, ymin, ymax)""")
 
     # Table "rectangle"
-    c.execute("""drop table if exists rectangle""")
-    c.execute("""create table rectangle (pid, side1, angle12, side2, angle23, side3, angle34, side4, angle41, minratio, maxratio, area)""")
+    if replace:
+        c.execute("""drop table if exists rectangle""")
+    c.execute(f"""
+        create table if not exists rectangle (
+            run integer not null,
+            pid {pid_type} not null,
+            part integer not null,
+            side1 real, angle12 real, side2 real, angle23 real,
+            side3 real, angle34 real, side4 real, angle41 real,
+            minratio real, maxratio real, area real,
+            primary key (run, pid, part)
+        ) without rowid
+    """)
 
     # Table "boxlike"
-    c.execute("""drop table if exists boxlike""")
-    c.execute("""create table boxlike (pid, hangle, left, langle, mid, rangle, right)""")
+    if replace:
+        c.execute("""drop table if exists boxlike""")
+    c.execute(f"""
+        create table if not exists boxlike (
+            run integer not null,
+            pid {pid_type} not null,
+            part integer not null,
+            hangle real, left real, langle real, mid real, rangle real, right real,
+            primary key (run, pid, part)
+        ) without rowid
+    """)
 
 
-def insert_main(conn, data):
+def insert_batches(conn, table, sql, data, batch_size=BATCH_SIZE):
+    """executemany sql over data in batches of batch_size rows
+
+    data can be any iterable, such as a generator, so rows are never all
+    held in memory. Logs the write rate and returns the number of rows.
+    """
     c = conn.cursor()
 
-    c.executemany(
-        """
-        insert into main
-        (pid, nearest1, nearest2)
-        values (?, ?, ?)
-        """,
-        data
+    rows = iter(data)
+    count = 0
+    start = time.perf_counter()
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        c.executemany(sql, batch)
+        count += len(batch)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    logger.info(f'Wrote {count} rows to {table} in {elapsed:.2f}s ({rate:.0f} rows/s)')
+    return count
+
+
+def _stage_pids(c, pids):
+    """Load pids into the temp table staged, for joining against"""
+    c.execute("""create temp table if not exists staged (pid primary key)""")
+    c.execute("""delete from staged""")
+    c.executemany("""insert or ignore into staged (pid) values (?)""", ((pid,) for pid in pids))
+
+
+def create_indexes(conn, pids=None, run=1):
+    """Add the bounding boxes of the parcels of run, or only of pids, to
+    parcel_bbox
+
+    Run once the parcels are loaded, so the R*Tree is built in one pass.
+    """
+    c = conn.cursor()
+
+    query = """
+        insert or replace into parcel_bbox (id, xmin, xmax, ymin, ymax)
+        select id, xmin, xmax, ymin, ymax from parcels
+        where run = ? and xmin is not null
+    """
+    if pids is not None:
+        _stage_pids(c, pids)
+        query += """ and pid in (select pid from staged)"""
+    c.execute(query, (run,))
+
+
+def select_extent(conn, xmin, ymin, xmax, ymax, run=None):
+    """Rows of main for the parcels with a bounding box touching the extent,
+    from every run or only from run"""
+    c = conn.cursor()
+
+    query = """
+        select main.* from parcel_bbox
+        join parcels on parcels.id = parcel_bbox.id
+        join main on main.run = parcels.run and main.pid = parcels.pid
+        where parcel_bbox.xmax >= ? and parcel_bbox.xmin <= ?
+        and parcel_bbox.ymax >= ? and parcel_bbox.ymin <= ?
+    """
+    parameters = (xmin, xmax, ymin, ymax)
+    if run is not None:
+        query += """ and main.run = ?"""
+        parameters += (run,)
+    query += """ order by main.run, main.pid, main.part"""
+    return c.execute(query, parameters).fetchall()
+
+
+def tag_rows(data, run):
+    """Prefix every row of data with run"""
+    return ((run, *row) for row in data)
+
+
+def insert_main(conn, data, num_nearest=2, batch_size=BATCH_SIZE, run=1):
+    return insert_batches(
+        conn,
+        'main',
+        upsert('main', ['run', 'pid', 'part', *nearest_columns(num_nearest), 'cx', 'cy'], ['run', 'pid', 'part']),
+        tag_rows(data, run),
+        batch_size,
     )
 
 
-def insert_boxlike(conn, data):
+def main_nearest_count(conn):
+    """Number of nearest distance columns in main"""
+    c = conn.cursor()
+
+    columns = [row[1] for row in c.execute("""pragma table_info(main)""")]
+    return sum(1 for column in columns if column.startswith('nearest'))
+
+
+def delete_main(conn, pids, run=1):
+    """Delete the rows of pids in run, returning the (cx, cy) of each
+    deleted row"""
+    c = conn.cursor()
+
+    _stage_pids(c, pids)
+    deleted = c.execute(
+        """select cx, cy from main where run = ? and pid in (select pid from staged)""", (run,)
+    ).fetchall()
+    c.execute("""delete from main where run = ? and pid in (select pid from staged)""", (run,))
+    return deleted
+
+
+def select_main_nearest(conn, num_nearest=2, run=1):
+    """(pid, part, nearest1, ..., cx, cy) of every row of run in main"""
+    c = conn.cursor()
+
+    return c.execute(
+        f"""select pid, part, {', '.join(nearest_columns(num_nearest))}, cx, cy from main where run = ?""",
+        (run,),
+    ).fetchall()
+
+
+def update_main_nearest(conn, data, num_nearest=2, run=1):
     c = conn.cursor()
 
     c.executemany(
-        """
-        insert into boxlike
-        (pid, hangle, left, langle, mid, rangle, right)
-        values (?, ?, ?, ?, ?, ?, ?)
+        f"""
+        update main
+        set {', '.join(f'{column} = ?' for column in nearest_columns(num_nearest))}
+        where pid = ? and part = ? and run = ?
         """,
-        data
+        ((*row, run) for row in data),
     )
 
 
-def insert_rectangle(conn, data):
+def insert_parcels(conn, data, batch_size=BATCH_SIZE, run=1):
+    return insert_batches(
+        conn,
+        'parcels',
+        upsert('parcels', ['run', 'pid', 'hash', 'xmin', 'ymin', 'xmax', 'ymax'], ['run', 'pid']),
+        tag_rows(data, run),
+        batch_size,
+    )
+
+
+def select_parcels(conn, run=1):
+    """Geometry hash of each pid recorded by run"""
     c = conn.cursor()
 
-    c.executemany(
+    return dict(c.execute("""select pid, hash from parcels where run = ?""", (run,)))
+
+
+def delete_parcels(conn, pids, run=1):
+    """Delete pids of run from parcels and their bounding boxes from
+    parcel_bbox"""
+    c = conn.cursor()
+
+    _stage_pids(c, pids)
+    c.execute(
         """
-        insert into rectangle
-        (pid, side1, angle12, side2, angle23, side3, angle34, side4, angle41, minratio, maxratio, area)
-        values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        delete from parcel_bbox where id in
+        (select id from parcels where run = ? and pid in (select pid from staged))
         """,
-        data
+        (run,),
+    )
+    c.execute("""delete from parcels where run = ? and pid in (select pid from staged)""", (run,))
+
+
+def delete_rows(conn, table, pids, run=1):
+    """Delete the rows of pids in run from a table keyed on (run, pid, part)"""
+    c = conn.cursor()
+
+    _stage_pids(c, pids)
+    c.execute(f"""delete from {table} where run = ? and pid in (select pid from staged)""", (run,))
+
+
+def insert_boxlike(conn, data, batch_size=BATCH_SIZE, run=1):
+    return insert_batches(
+        conn,
+        'boxlike',
+        upsert(
+            'boxlike',
+            ['run', 'pid', 'part', 'hangle', 'left', 'langle', 'mid', 'rangle', 'right'],
+            ['run', 'pid', 'part'],
+        ),
+        tag_rows(data, run),
+        batch_size,
+    )
+
+
+def insert_rectangle(conn, data, batch_size=BATCH_SIZE, run=1):
+    return insert_batches(
+        conn,
+        'rectangle',
+        upsert(
+            'rectangle',
+            [
+                'run', 'pid', 'part', 'side1', 'angle12', 'side2', 'angle23',
+                'side3', 'angle34', 'side4', 'angle41', 'minratio', 'maxratio', 'area',
+            ],
+            ['run', 'pid', 'part'],
+        ),
+        tag_rows(data, run),
+        batch_size,
     )
 
 
-def connection(filename):
-    return sqlite3.connect(filename)
+def create_sweep(conn, pid_type='integer', replace=True):
+    """Create the sweep table, dropping it first if replace is set
+
+    The runs of other tables are kept either way.
+    """
+    c = conn.cursor()
+
+    create_runs(conn, replace=False)
+
+    # Table "sweep", the matches of each parameter combination
+    if replace:
+        c.execute("""drop table if exists sweep""")
+    c.execute(f"""
+        create table if not exists sweep (
+            run integer not null,
+            inline_tolerance real not null,
+            angle_tolerance real not null,
+            pid {pid_type} not null,
+            part integer not null,
+            cx real not null,
+            cy real not null,
+            primary key (run, inline_tolerance, angle_tolerance, pid, part)
+        ) without rowid
+    """)
+
+
+def insert_sweep(conn, data, batch_size=BATCH_SIZE, run=1):
+    return insert_batches(
+        conn,
+        'sweep',
+        upsert(
+            'sweep',
+            ['run', 'inline_tolerance', 'angle_tolerance', 'pid', 'part', 'cx', 'cy'],
+            ['run', 'inline_tolerance', 'angle_tolerance', 'pid', 'part'],
+        ),
+        tag_rows(data, run),
+        batch_size,
+    )
+
+
+def connection(filename, bulk=False, shared=False):
+    """Connect to filename
+
+    bulk applies BULK_PRAGMAS, for a database rebuilt if a run fails.
+    shared applies SHARED_PRAGMAS instead, for a database other runs may
+    be writing to at the same time.
+    """
+    if shared:
+        conn = sqlite3.connect(filename, timeout=SHARED_TIMEOUT)
+        pragmas = SHARED_PRAGMAS
+    else:
+        conn = sqlite3.connect(filename)
+        pragmas = BULK_PRAGMAS if bulk else {}
+    for name, value in pragmas.items():
+        conn.execute(f"""pragma {name} = {value}""")
+    return conn
+
+
+class Writer:
+    """Runs database writes on a thread of their own
+
+    connect is called on the writer thread to open its connection. Each
+    submit queues func(conn, *args), blocking while maxsize writes are
+    waiting, so a slow database holds back the stages feeding it rather
+    than letting rows pile up in memory. Writes are committed together when
+    the writer closes without an error, and rolled back otherwise.
+
+    With commit_each, each write is committed as soon as it is made, so
+    other runs sharing the database are only locked out while rows are
+    being written. Writes committed before an error are then kept.
+    """
+
+    def __init__(self, connect, maxsize=4, commit_each=False, batch_size=BATCH_SIZE):
+        self.commit_each = commit_each
+        self.batch_size = batch_size
+        self.writes = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(connect,), name='writer', daemon=True)
+        self.thread.start()
+
+    def _run(self, connect):
+        conn = None
+        write = None
+        try:
+            conn = connect()
+            write = self.writes.get()
+            while not isinstance(write, bool):
+                func, args = write
+                func(conn, *args)
+                if self.commit_each:
+                    conn.commit()
+                write = self.writes.get()
+            if write:
+                conn.commit()
+        except BaseException as error:
+            self.error = error
+            # Keep taking writes so submit never blocks, until close
+            while not isinstance(write, bool):
+                write = self.writes.get()
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def submit(self, func, *args):
+        if self.error is not None:
+            raise self.error
+        self.writes.put((func, args))
+
+    def stream(self, func, *args):
+        """Function taking rows for func(conn, rows, *args) in lists, and
+        None once there are no more
+
+        Rows are gathered until batch_size are waiting, then submitted as
+        one write, so several streams can be written to at once. A stream
+        is fed from one thread.
+        """
+        pending = []
+
+        def put(chunk):
+            if chunk is not None:
+                pending.extend(chunk)
+            if pending and (chunk is None or len(pending) >= self.batch_size):
+                self.submit(func, list(pending), *args)
+                pending.clear()
+
+        return put
+
+    def close(self, commit=True):
+        self.writes.put(commit)
+        self.thread.join()
+        if commit and self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
@@ -0,0 +1,209 @@
+import heapq
+import math
+
+import numpy as np
+
+from shapeanalysis.rings import ring_bboxes
+from shapeanalysis.shapereader import ragged_indexes
+
+# Segment pairs compared at once when measuring a ring against candidates
+SEGMENT_BATCH = 1 << 20
+
+
+def bbox_distances(bbox, bboxes):
+    """Least distance between bbox and each of bboxes, a lower bound on the
+    distance between anything inside them"""
+    dx = np.maximum(np.maximum(bboxes[..., 0] - bbox[2], bbox[0] - bboxes[..., 2]), 0)
+    dy = np.maximum(np.maximum(bboxes[..., 1] - bbox[3], bbox[1] - bboxes[..., 3]), 0)
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def point_segment_distances(points, starts, ends):
+    """Distance from each point to the segment from start to end"""
+    segment = ends - starts
+    offset = points - starts
+    length2 = np.einsum('...i,...i->...', segment, segment)
+    along = np.einsum('...i,...i->...', offset, segment)
+    t = np.clip(np.divide(along, length2, out=np.zeros_like(along), where=length2 > 0), 0, 1)
+    gap = offset - t[..., None] * segment
+    return np.sqrt(np.einsum('...i,...i->...', gap, gap))
+
+
+def segment_distances(a_starts, a_ends, b_starts, b_ends):
+    """Least distance between segments a and b, 0 where they cross
+
+    Inputs broadcast against each other as (..., 2) arrays.
+    """
+    def orientation(p, q, r):
+        return np.sign((q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0]))
+
+    distances = np.minimum.reduce([
+        point_segment_distances(a_starts, b_starts, b_ends),
+        point_segment_distances(a_ends, b_starts, b_ends),
+        point_segment_distances(b_starts, a_starts, a_ends),
+        point_segment_distances(b_ends, a_starts, a_ends),
+    ])
+    # Touching and collinear overlaps already measure 0 from an end point
+    crossing = (
+        (orientation(a_starts, a_ends, b_starts) * orientation(a_starts, a_ends, b_ends) < 0) &
+        (orientation(b_starts, b_ends, a_starts) * orientation(b_starts, b_ends, a_ends) < 0)
+    )
+    return np.where(crossing, 0.0, distances)
+
+
+def ring_distances(points, coords, ring_offsets, rings):
+    """Least distance from the edges of a ring to the edges of each of rings
+
+    points is the query ring and rings index rings of coords and
+    ring_offsets. Rings without an edge are infinitely far.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    rings = np.asarray(rings, dtype=np.int64)
+    distances = np.full(len(rings), np.inf)
+    counts = np.maximum(np.diff(ring_offsets)[rings] - 1, 0)
+    if len(points) < 2 or not np.any(counts):
+        return distances
+    a_starts, a_ends = points[:-1, None], points[1:, None]
+
+    # Batches of whole rings, bounded by the number of segment pairs
+    batch = max(1, SEGMENT_BATCH // len(a_starts))
+    first = 0
+    cumulative = np.cumsum(counts)
+    while first < len(rings):
+        before = cumulative[first - 1] if first else 0
+        last = max(first + 1, int(np.searchsorted(cumulative, before + batch, side='right')))
+        selected = np.arange(first, last)[counts[first:last] > 0]
+        if len(selected):
+            segment_starts = ragged_indexes(ring_offsets[rings[selected]], counts[selected])
+            pairs = segment_distances(a_starts, a_ends, coords[segment_starts], coords[segment_starts + 1])
+            boundaries = np.cumsum(counts[selected]) - counts[selected]
+            distances[selected] = np.minimum.reduceat(pairs.min(axis=0), boundaries)
+        first = last
+    return distances
+
+
+class PackedRTree:
+    """Static R-tree of bounding boxes packed with Sort-Tile-Recursive
+
+    Leaves are sorted into vertical slices by x then by y within each
+    slice, and every level groups node_size consecutive nodes of the level
+    below it, so the tree is a list of arrays without pointers.
+    """
+
+    def __init__(self, bboxes, node_size=16):
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.node_size = node_size
+        count = len(bboxes)
+        centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+        slice_size = node_size * max(1, math.ceil(math.sqrt(math.ceil(count / node_size))))
+        by_x = np.argsort(centers[:, 0], kind='stable')
+        slices = np.empty(count, dtype=np.int64)
+        slices[by_x] = np.arange(count) // slice_size
+        # Leaf slot i holds item order[i]
+        self.order = np.lexsort((centers[:, 1], slices))
+        self.levels = [bboxes[self.order]]
+        while len(self.levels[-1]) > 1:
+            boxes = self.levels[-1]
+            starts = np.arange(0, len(boxes), node_size)
+            self.levels.append(np.column_stack([
+                np.fmin.reduceat(boxes[:, 0], starts),
+                np.fmin.reduceat(boxes[:, 1], starts),
+                np.fmax.reduceat(boxes[:, 2], starts),
+                np.fmax.reduceat(boxes[:, 3], starts),
+            ]))
+
+    def __len__(self):
+        return len(self.order)
+
+    def _children(self, level, node):
+        return range(node * self.node_size, min((node + 1) * self.node_size, len(self.levels[level - 1])))
+
+    def nearest(self, bbox):
+        """Yields (bound, item) in increasing bounding box distance from bbox"""
+        if not len(self):
+            return
+        top = len(self.levels) - 1
+        heap = [(0.0, top, 0)]
+        while heap:
+            bound, level, node = heapq.heappop(heap)
+            if level == 0:
+                yield bound, int(self.order[node])
+                continue
+            children = np.asarray(self._children(level, node))
+            bounds = bbox_distances(bbox, self.levels[level - 1][children])
+            for child_bound, child in zip(bounds.tolist(), children.tolist()):
+                if not math.isnan(child_bound):
+                    heapq.heappush(heap, (child_bound, level - 1, child))
+
+    def within(self, bbox, distance):
+        """Items with a bounding box no more than distance from bbox"""
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(len(self.levels) - 1, -1, -1):
+            keep = bbox_distances(bbox, self.levels[level][nodes]) <= distance
+            nodes = nodes[keep]
+            if level:
+                children = ragged_indexes(nodes * self.node_size, np.full(len(nodes), self.node_size))
+                nodes = children[children < len(self.levels[level - 1])]
+        return self.order[nodes]
+
+
+class PolygonIndex:
+    """Nearest rings by the distance between their edges
+
+    Candidates come from a PackedRTree of the ring bounding boxes: the
+    rings nearest by bounding box give an upper bound on the k-th edge
+    distance, and only rings with a bounding box within that bound are
+    measured exactly. ids work as in NeighborIndex.
+    """
+
+    def __init__(self, store, ids=None, node_size=16):
+        self.coords = store.coords
+        self.ring_offsets = store.ring_offsets
+        self.bboxes = ring_bboxes(store.coords, store.ring_offsets)
+        self.tree = PackedRTree(self.bboxes, node_size)
+        self.ids = None if ids is None else np.asarray(list(ids) + [None], dtype=object)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def _distances(self, points, rings, ring_id):
+        distances = ring_distances(points, self.coords, self.ring_offsets, rings)
+        if ring_id is not None and self.ids is not None:
+            distances[self.ids[rings] == ring_id] = np.inf
+        return distances
+
+    def query(self, store, num_nearest=1, ids=None, max_distance=np.inf):
+        """Edge distances and indexes of the num_nearest nearest rings
+
+        Returns (distances, neighbors) arrays of shape (len(store),
+        num_nearest), with missing neighbors at a distance of inf and an
+        index of len(self), as NeighborIndex.query.
+        """
+        if num_nearest < 1:
+            raise ValueError("num_nearest must be at least 1")
+        ids = [None] * len(store) if ids is None else list(ids)
+        distances = np.full((len(store), num_nearest), np.inf)
+        neighbors = np.full((len(store), num_nearest), len(self), dtype=np.int64)
+        query_bboxes = ring_bboxes(store.coords, store.ring_offsets)
+        for index, (points, ring_id, bbox) in enumerate(zip(store.rings(), ids, query_bboxes)):
+            if np.isnan(bbox[0]):
+                continue
+            # Upper bound from the rings nearest by bounding box
+            bound = np.inf
+            nearby = []
+            for _, item in self.tree.nearest(bbox):
+                if ring_id is None or self.ids is None or self.ids[item] != ring_id:
+                    nearby.append(item)
+                    if len(nearby) == num_nearest:
+                        break
+            if len(nearby) == num_nearest:
+                bound = self._distances(points, nearby, ring_id).max()
+            bound = min(bound, max_distance)
+
+            candidates = self.tree.within(bbox, bound)
+            found = self._distances(points, candidates, ring_id)
+            order = np.argsort(found, kind='stable')[:num_nearest]
+            order = order[np.isfinite(found[order]) & (found[order] <= max_distance)]
+            distances[index, :len(order)] = found[order]
+            neighbors[index, :len(order)] = candidates[order]
+        return distances, neighbors
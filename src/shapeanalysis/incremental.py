@@ -0,0 +1,165 @@
+import hashlib
+import logging
+
+import numpy as np
+import scipy.spatial
+
+import shapeanalysis.database as database
+from shapeanalysis.metrics import boxlike_rows
+from shapeanalysis.process_data import nearest_distances
+
+logger = logging.getLogger(__name__)
+
+
+def record_hashes(store):
+    """Yields (record, hash, bbox) for each record with rings in store
+
+    Rings of a record are expected to be contiguous, as read_stores
+    produces them. The hash covers the ring lengths and coordinates, so
+    reordering or splitting rings counts as a change. bbox is the
+    (xmin, ymin, xmax, ymax) of the record, None if it has no points.
+    """
+    if not len(store):
+        return
+    bounds = np.flatnonzero(np.diff(store.ring_records)) + 1
+    starts = np.concatenate(([0], bounds))
+    stops = np.concatenate((bounds, [len(store)]))
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        digest = hashlib.sha1(store.ring_lengths[start:stop].astype('<i8').tobytes())
+        coords = store.coords[store.ring_offsets[start]:store.ring_offsets[stop]]
+        digest.update(np.ascontiguousarray(coords, dtype='<f8').tobytes())
+        bbox = (*coords.min(axis=0).tolist(), *coords.max(axis=0).tolist()) if len(coords) else None
+        yield int(store.ring_records[start]), digest.digest(), bbox
+
+
+def store_parcel_rows(store):
+    """(pid, hash, xmin, ymin, xmax, ymax) of each record with rings in store"""
+    for record, digest, bbox in record_hashes(store):
+        yield (store.pids[record], digest, *(bbox or (None,) * 4))
+
+
+def parcel_stores(stores, on_parcels):
+    """Yields each store unchanged after calling on_parcels with a list of
+    its store_parcel_rows
+
+    Unlike GeometryDiff, nothing is kept once a store has been passed on,
+    so a full run holds no state per record.
+    """
+    for store in stores:
+        on_parcels(list(store_parcel_rows(store)))
+        yield store
+
+
+class GeometryDiff:
+    """Compares the records of a run against the hashes of a previous one
+
+    Pids are assumed to be unique within a shapefile.
+    """
+
+    def __init__(self, previous):
+        self.previous = previous
+        self.hashes = {}
+        self.bboxes = {}
+
+    def changed_stores(self, stores):
+        """Yields each store holding only the rings of added or modified records"""
+        for store in stores:
+            changed = np.zeros(len(store.pids), dtype=bool)
+            for record, digest, bbox in record_hashes(store):
+                pid = store.pids[record]
+                changed[record] = self.previous.get(pid) != digest
+                self.hashes[pid] = digest
+                self.bboxes[pid] = bbox
+            yield store.filter(changed[store.ring_records])
+
+    def parcel_rows(self, pids=None):
+        """(pid, hash, xmin, ymin, xmax, ymax) of pids, every record by default"""
+        for pid in self.hashes if pids is None else pids:
+            yield (pid, self.hashes[pid], *(self.bboxes[pid] or (None,) * 4))
+
+    @property
+    def added(self):
+        return self.hashes.keys() - self.previous.keys()
+
+    @property
+    def removed(self):
+        return self.previous.keys() - self.hashes.keys()
+
+    @property
+    def modified(self):
+        return {pid for pid in self.hashes.keys() & self.previous.keys() if self.hashes[pid] != self.previous[pid]}
+
+
+def affected_points(points, kth_distances, moved_points, max_distance=np.inf):
+    """Mask of the points whose nearest neighbours could have changed
+
+    A point is affected when a moved point, at its old or its new position,
+    lies within its previous k-th nearest distance, or max_distance if
+    that is nearer. Points without a previous distance (nan) are always
+    affected.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    kth_distances = np.minimum(np.asarray(kth_distances, dtype=np.float64), max_distance)
+    if not len(moved_points):
+        return np.isnan(kth_distances)
+    tree = scipy.spatial.cKDTree(np.asarray(moved_points, dtype=np.float64).reshape(-1, 2))
+    distances, _ = tree.query(points)
+    return ~(distances > kth_distances)
+
+
+def update_database(conn, diff, matches, parts, centroid_points, num_nearest=2, memory_budget=None, max_distance=np.inf, run=1, windows=None, rectangles=None):
+    """Apply the changes found by diff to the rows of a previous run
+
+    matches, parts and centroid_points hold the matching rings of the added
+    and modified records only, see classify_matches, with windows their
+    box-like windows if boxlike rows are kept. rectangles holds the rectangle rows of those records if
+    rectangle rows are kept.
+
+    Rows of removed and modified records are replaced in every table, then
+    nearest distances are recomputed where they could have changed.
+    memory_budget and max_distance are passed on to nearest_distances, and
+    num_nearest must match the columns of main. Returns the number of rows
+    run has in main.
+    """
+    if database.main_nearest_count(conn) != num_nearest:
+        raise ValueError(f'The previous run measured a different number of nearest distances than {num_nearest}')
+    added, modified, removed = diff.added, diff.modified, diff.removed
+    logger.info(f'Parcels added: {len(added)}, modified: {len(modified)}, removed: {len(removed)}')
+
+    moved_points = database.delete_main(conn, modified | removed, run)
+    database.insert_main(
+        conn,
+        (
+            (pid, part, *[None] * num_nearest, float(point[0]), float(point[1]))
+            for pid, part, point in zip(matches.ring_pids, np.asarray(parts).tolist(), centroid_points)
+        ),
+        num_nearest,
+        run=run,
+    )
+    moved_points.extend(tuple(point) for point in centroid_points)
+    database.delete_rows(conn, 'rectangle', modified | removed, run)
+    if rectangles is not None:
+        database.insert_rectangle(conn, rectangles, run=run)
+    database.delete_rows(conn, 'boxlike', modified | removed, run)
+    if windows is not None:
+        database.insert_boxlike(conn, boxlike_rows(matches, parts, windows), run=run)
+    database.delete_parcels(conn, modified | removed, run)
+    database.insert_parcels(conn, diff.parcel_rows(added | modified), run=run)
+    database.create_indexes(conn, added | modified, run)
+
+    rows = database.select_main_nearest(conn, num_nearest, run)
+    if not rows:
+        return 0
+    keys = [row[:2] for row in rows]
+    nearest = np.array([row[2:-2] for row in rows], dtype=np.float64)
+    points = np.array([row[-2:] for row in rows], dtype=np.float64)
+    affected = np.flatnonzero(affected_points(points, nearest[:, -1], moved_points, max_distance))
+    logger.info(f'Recomputing nearest distances for {len(affected)} of {len(rows)} centroids')
+    distances, _ = nearest_distances(points, num_nearest, affected, memory_budget, max_distance=max_distance)
+    database.update_main_nearest(
+        conn,
+        ((*map(float, dists), *keys[index]) for index, dists in zip(affected.tolist(), distances)),
+        num_nearest,
+        run,
+    )
+    return len(rows)
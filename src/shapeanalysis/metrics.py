@@ -0,0 +1,123 @@
+import numpy as np
+
+# Columns of a rectangle row after (pid, part)
+RECTANGLE_COLUMNS = (
+    'side1', 'angle12', 'side2', 'angle23', 'side3', 'angle34', 'side4', 'angle41',
+    'minratio', 'maxratio', 'area',
+)
+
+# Columns of a boxlike row after (pid, part)
+BOXLIKE_COLUMNS = ('hangle', 'left', 'langle', 'mid', 'rangle', 'right')
+
+
+def is_quad(sig_points):
+    """Whether significant points, wrapped as in wrapped_ring, have four sides"""
+    return sig_points is not None and len(sig_points) == 6
+
+
+def quad_rings(store):
+    """Indexes of the rings of a store of significant points with four sides
+
+    Significant points are wrapped, see wrapped_ring, so a four sided ring
+    has six points.
+    """
+    return np.flatnonzero(store.ring_lengths == 6)
+
+
+def quad_points(store, rings):
+    """(len(rings), 4, 2) array of the corners of four sided rings"""
+    starts = store.ring_offsets[:-1][np.asarray(rings, dtype=np.int64)]
+    return store.coords[starts[:, None] + np.arange(1, 5)]
+
+
+def rectangle_metrics(quads):
+    """Rectangle columns of each quadrilateral in a (n, 4, 2) array
+
+    side1 runs from the first corner to the second and angle12 is the
+    interior angle between side1 and side2, in radians. minratio and
+    maxratio are the least and greatest ratio of the shorter to the longer
+    side at any corner, both 1 for a square. area is the shoelace area.
+    """
+    quads = np.asarray(quads, dtype=np.float64).reshape(-1, 4, 2)
+    edges = np.roll(quads, -1, axis=1) - quads
+    sides = np.hypot(edges[..., 0], edges[..., 1])
+
+    # Corner i + 1 joins edge i to edge i + 1
+    incoming, outgoing = edges, np.roll(edges, -1, axis=1)
+    cross = incoming[..., 0] * outgoing[..., 1] - incoming[..., 1] * outgoing[..., 0]
+    dot = np.einsum('...i,...i->...', incoming, outgoing)
+    signed_area = 0.5 * np.sum(quads[..., 0] * np.roll(quads[..., 1], -1, axis=1) - np.roll(quads[..., 0], -1, axis=1) * quads[..., 1], axis=1)
+    orientation = np.where(signed_area < 0, -1.0, 1.0)[:, None]
+    # Interior angle is pi less the turn, which is negative at a reflex corner
+    angles = np.pi - np.arctan2(cross * orientation, dot)
+
+    following = np.roll(sides, -1, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = np.minimum(sides, following) / np.maximum(sides, following)
+
+    metrics = np.empty((len(quads), len(RECTANGLE_COLUMNS)))
+    metrics[:, 0:8:2] = sides
+    metrics[:, 1:8:2] = angles
+    metrics[:, 8] = ratios.min(axis=1)
+    metrics[:, 9] = ratios.max(axis=1)
+    metrics[:, 10] = np.abs(signed_area)
+    return metrics
+
+
+def rectangle_rows(store, parts):
+    """(pid, part, side1, ..., area) of each four sided ring in a store of
+    significant points
+
+    parts holds the part of each ring in store, see classify_matches.
+    """
+    rings = quad_rings(store)
+    metrics = rectangle_metrics(quad_points(store, rings))
+    for pid, part, values in zip(store.ring_pids[rings].tolist(), np.asarray(parts)[rings].tolist(), metrics.tolist()):
+        yield (pid, part, *values)
+
+
+def window_points(store, windows):
+    """(len(store), 4, 2) array of the box-like window of each ring
+
+    windows holds the find_box index of each ring, so the window of ring r
+    is its significant points windows[r] - 1 through windows[r] + 2.
+    """
+    starts = store.ring_offsets[:-1] + np.asarray(windows, dtype=np.int64)
+    return store.coords[starts[:, None] + np.arange(-1, 3)]
+
+
+def boxlike_metrics(windows):
+    """Boxlike columns of each window of four points in a (n, 4, 2) array
+
+    hangle is the rotation of the middle edge from horizontal, modulo a
+    right angle as in mid_line_rotation. left, mid and right are the edge
+    lengths and langle and rangle the angles at either end of the middle
+    edge, in radians.
+    """
+    windows = np.asarray(windows, dtype=np.float64).reshape(-1, 4, 2)
+    edges = np.diff(windows, axis=1)
+    lengths = np.hypot(edges[..., 0], edges[..., 1])
+
+    # Angle at a corner between the reversed edge into it and the edge out
+    incoming, outgoing = -edges[:, :-1], edges[:, 1:]
+    cross = incoming[..., 0] * outgoing[..., 1] - incoming[..., 1] * outgoing[..., 0]
+    dot = np.einsum('...i,...i->...', incoming, outgoing)
+    angles = np.arctan2(np.abs(cross), dot)
+
+    mid = edges[:, 1]
+    metrics = np.empty((len(windows), len(BOXLIKE_COLUMNS)))
+    metrics[:, 0] = np.arctan2(np.abs(mid[:, 1]), mid[:, 0]) % (np.pi / 2)
+    metrics[:, 1:6:2] = lengths
+    metrics[:, 2:6:2] = angles
+    return metrics
+
+
+def boxlike_rows(matches, parts, windows):
+    """(pid, part, hangle, ..., right) of each ring in matches
+
+    parts and windows hold the part and find_box index of each ring, as
+    classify_matches returns them.
+    """
+    metrics = boxlike_metrics(window_points(matches, windows))
+    for pid, part, values in zip(matches.ring_pids.tolist(), np.asarray(parts).tolist(), metrics.tolist()):
+        yield (pid, part, *values)
@@ -0,0 +1,101 @@
+import collections
+
+import numpy as np
+import scipy.spatial
+
+from shapeanalysis.rings import ring_centroids
+from shapeanalysis.store import read_stores
+
+# Reference sets main can measure matched parcels against
+REFERENCE_SETS = ('matched', 'all')
+
+
+class NeighborIndex:
+    """Tree over a reference set of points, built once for many queries
+
+    ids label the reference points, such as with their pid. A query point
+    given an id never has a reference point with the same id as a
+    neighbor, so a parcel is not measured against itself.
+    """
+
+    def __init__(self, points, ids=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.tree = scipy.spatial.cKDTree(self.points)
+        self.ids = None
+        self.max_repeats = 0
+        if ids is not None:
+            # The last id stands in for the missing neighbor index
+            self.ids = np.empty(len(self.points) + 1, dtype=object)
+            self.ids[:-1] = list(ids)
+            counts = collections.Counter(self.ids[:-1].tolist())
+            self.max_repeats = max(counts.values(), default=0)
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, points, num_nearest=1, ids=None, max_distance=np.inf):
+        """Distances and reference indexes of the num_nearest nearest points
+
+        Returns (distances, neighbors) arrays of shape (len(points),
+        num_nearest). Only neighbors within max_distance are searched for,
+        missing ones have a distance of inf and an index of len(self).
+        """
+        if num_nearest < 1:
+            raise ValueError("num_nearest must be at least 1")
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        shape = (len(points), num_nearest)
+        if not len(points):
+            return np.empty(shape), np.empty(shape, dtype=np.int64)
+
+        # Ask for enough extra neighbors to drop every one sharing an id
+        extra = self.max_repeats if ids is not None and self.ids is not None else 0
+        distances, neighbors = self.tree.query(
+            points,
+            num_nearest + extra,
+            distance_upper_bound=max_distance,
+            workers=-1,
+        )
+        distances = distances.reshape(len(points), -1)
+        neighbors = neighbors.reshape(len(points), -1)
+        if extra:
+            ids = np.asarray(list(ids), dtype=object)
+            excluded = self.ids[neighbors] == ids[:, None]
+            # Stable, so the kept neighbors stay nearest first
+            order = np.argsort(excluded, axis=1, kind='stable')[:, :num_nearest]
+            distances = np.take_along_axis(distances, order, axis=1)
+            neighbors = np.take_along_axis(neighbors, order, axis=1)
+            dropped = np.take_along_axis(excluded, order, axis=1)
+            distances[dropped] = np.inf
+            neighbors[dropped] = len(self)
+        return distances, neighbors
+
+
+class ReferenceCollector:
+    """Records the pid and centroid of every ring streamed past
+
+    With keep_stores the stores themselves are kept as well, for measuring
+    against the rings rather than their centroids. centroid is the method
+    of ring_centroids.
+    """
+
+    def __init__(self, keep_stores=False, centroid='vertex'):
+        self.pids = []
+        self.points = []
+        self.stores = [] if keep_stores else None
+        self.centroid = centroid
+
+    def collect(self, stores):
+        for store in stores:
+            self.pids.extend(store.ring_pids.tolist())
+            self.points.extend(ring_centroids(store, self.centroid))
+            if self.stores is not None:
+                self.stores.append(store)
+            yield store
+
+
+def shapefile_reference(filename, chunk_size=10000, centroid='vertex'):
+    """(pids, centroids) of every ring in a shapefile"""
+    collector = ReferenceCollector(centroid=centroid)
+    for _ in collector.collect(read_stores(filename, chunk_size)):
+        pass
+    return collector.pids, collector.points
@@ -0,0 +1,227 @@
+import collections
+import concurrent.futures
+import functools
+import itertools
+import logging
+import queue
+import threading
+
+import numpy as np
+
+from shapeanalysis.cache import ring_key
+from shapeanalysis.metrics import is_quad, rectangle_rows
+from shapeanalysis.process_data import PREFILTER_RULES, Classification, classify_ring, prefilter_rings, sweep_ring
+from shapeanalysis.rings import ring_centroids
+from shapeanalysis.store import PolygonStore
+
+logger = logging.getLogger(__name__)
+
+
+def classify_store(store, inline_tolerance, angle_tolerance):
+    """Classification of every ring in store
+
+    Only matching and four sided rings keep their sig_points, so the
+    results stay compact when sent back from a worker process. Rings the
+    prefilters reject are never simplified, so they have no sig_points.
+    """
+    rules = prefilter_rings(store.coords, store.ring_offsets)
+    results = []
+    for index, rule in enumerate(rules.tolist()):
+        if rule >= 0:
+            results.append(Classification(None, False, None, PREFILTER_RULES[rule]))
+            continue
+        result = classify_ring(store.ring(index), inline_tolerance, angle_tolerance, prefilter=False)
+        if not result.has_box and not is_quad(result.sig_points):
+            result = result._replace(sig_points=None)
+        results.append(result)
+    return results
+
+
+def ordered_map(func, jobs, workers=1):
+    """Yields (job, func(job.work)) in job order
+
+    With more than one worker func runs in a process pool, with at most
+    two jobs per worker submitted at a time.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield job, func(job.work)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append((job, executor.submit(func, job.work)))
+            if len(pending) >= 2 * workers:
+                job, future = pending.popleft()
+                yield job, future.result()
+        while pending:
+            job, future = pending.popleft()
+            yield job, future.result()
+
+
+def prefetch(iterable, maxsize=4):
+    """Yields the items of iterable, produced ahead on a thread of its own
+
+    At most maxsize items wait to be consumed, so the producer is held
+    back when the consumer falls behind. An exception raised by the
+    producer is raised again by the consumer, and the producer stops at
+    its next item when the consumer stops early.
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as error:
+            put((False, error))
+
+    thread = threading.Thread(target=produce, name='prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            more, item = items.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# A store to classify, with the part of it missing from the cache as work
+Job = collections.namedtuple('Job', ['store', 'work', 'keys', 'cached'])
+
+
+def _jobs(stores, cache, params):
+    for store in stores:
+        if cache is None:
+            yield Job(store, store, None, None)
+            continue
+        keys = [ring_key(points, *params) for points in store.rings()]
+        cached = cache.lookup(keys)
+        misses = [i for i, result in enumerate(cached) if result is None]
+        yield Job(store, store.take(misses), keys, cached)
+
+
+def classify_matches(stores, inline_tolerance, angle_tolerance, workers=1, cache=None, centroid='vertex', on_rectangles=None):
+    """Store of all matching simplified rings, in the order of the input
+    stores, with the index of the box-like window of each match
+
+    With more than one worker the stores are classified in a process pool.
+    Only their coordinate arrays and the compact results are sent between
+    processes. Results found in cache are reused rather than recomputed.
+
+    Returns (matches, parts, windows, centroids). parts holds the index of
+    each match among the rings of its record, see ring_parts, which with
+    its pid keys its rows in every table. See find_box for the windows.
+    centroids are the ring_centroids of each match before simplification,
+    found with the centroid method as they are for a reference set.
+
+    on_rectangles, if given, is called with a list of the rectangle_rows of
+    the four sided rings of each store, matching or not, once it has been
+    classified. Rings the prefilters reject are not simplified, so they
+    have no rectangle rows.
+    """
+    func = functools.partial(
+        classify_store,
+        inline_tolerance=inline_tolerance,
+        angle_tolerance=angle_tolerance,
+    )
+    # Keyed on the defaults of classify_ring
+    params = (inline_tolerance, angle_tolerance, 10, 80)
+    match_stores = []
+    windows = []
+    parts = []
+    centroids = []
+    counts = collections.Counter()
+    for job, results in ordered_map(func, _jobs(stores, cache, params), workers):
+        for result in results:
+            counts[result.rejected or 'simplified'] += 1
+        if job.cached is not None:
+            cache.add([key for key, hit in zip(job.keys, job.cached) if hit is None], results)
+            counts['cached'] += len(job.store) - len(results)
+            computed = iter(results)
+            results = [hit if hit is not None else next(computed) for hit in job.cached]
+        ring_parts = job.store.ring_parts
+        indexes = [index for index, result in enumerate(results) if result.has_box]
+        match_stores.append(PolygonStore.from_rings([(job.store.ring_pids[index], results[index].sig_points) for index in indexes]))
+        parts.append(ring_parts[indexes])
+        windows.extend(results[index].window for index in indexes)
+        centroids.append(ring_centroids(job.store.take(indexes), centroid))
+        if on_rectangles is not None:
+            quads = [index for index, result in enumerate(results) if is_quad(result.sig_points)]
+            quad_store = PolygonStore.from_rings([(job.store.ring_pids[index], results[index].sig_points) for index in quads])
+            on_rectangles(list(rectangle_rows(quad_store, ring_parts[quads])))
+        logger.debug(f'Processed chunk {len(match_stores)}')
+
+    total = sum(counts.values())
+    skipped = ', '.join(f'{rule}={counts[rule]}' for rule in PREFILTER_RULES)
+    logger.info(f'Prefilters skipped {total - counts["simplified"] - counts["cached"]} of {total} rings ({skipped})')
+    if cache is not None:
+        logger.info(f'Cache hits: {cache.hits}, misses: {cache.misses}')
+    parts = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+    centroids = np.concatenate(centroids) if centroids else np.empty((0, 2))
+    return PolygonStore.concatenate(match_stores), parts, np.array(windows, dtype=np.int64), centroids
+
+
+def sweep_store(store, inline_tolerances, angle_tolerances):
+    """Indexes of the matching rings in store for each parameter combination
+
+    Combinations are in the order of itertools.product(inline_tolerances,
+    angle_tolerances). Returns (matches, sig_points) where sig_points maps
+    a ring index to the significant points of each combination.
+    """
+    count = len(inline_tolerances) * len(angle_tolerances)
+    matches = [[] for _ in range(count)]
+    sig_points = {}
+    rules = prefilter_rings(store.coords, store.ring_offsets)
+    for index in np.flatnonzero(rules < 0).tolist():
+        results = sweep_ring(store.ring(index), inline_tolerances, angle_tolerances, prefilter=False)
+        if not any(result.has_box for result in results):
+            continue
+        sig_points[index] = [result.sig_points if result.has_box else None for result in results]
+        for combination, result in enumerate(results):
+            if result.has_box:
+                matches[combination].append(index)
+    return matches, sig_points
+
+
+def sweep_chunks(stores, inline_tolerances, angle_tolerances, workers=1):
+    """Yields a dict of the matching simplified rings of each store for each
+    parameter combination, in the order of the input stores
+
+    Dicts are keyed on (inline_tolerance, angle_tolerance), in the order of
+    itertools.product(inline_tolerances, angle_tolerances), and hold
+    (matches, parts) with parts as classify_matches returns them. Each ring
+    is simplified once for every tolerance, see sweep_ring.
+    """
+    func = functools.partial(
+        sweep_store,
+        inline_tolerances=inline_tolerances,
+        angle_tolerances=angle_tolerances,
+    )
+    combinations = list(itertools.product(inline_tolerances, angle_tolerances))
+    jobs = (Job(store, store, None, None) for store in stores)
+    for job, (matches, sig_points) in ordered_map(func, jobs, workers):
+        pids = job.store.ring_pids
+        ring_parts = job.store.ring_parts
+        chunk = {}
+        for position, (combination, indexes) in enumerate(zip(combinations, matches)):
+            rings = [(pids[index], sig_points[index][position]) for index in indexes]
+            chunk[combination] = PolygonStore.from_rings(rings), ring_parts[indexes]
+        yield chunk
@@ -1,8 +1,13 @@
+import heapq
+import math
+from collections import namedtuple
 from math import isclose
 
 import numpy as np
 import scipy.spatial
 
+from shapeanalysis.tiled import drop_self, query_bytes, tiled_nearest_distances
+
 
 class PointData:
 
@@ -30,6 +35,22 @@ def less_or_close(a, b, *args, **kwargs):
     return a < b or isclose(a, b, *args, **kwargs)
 
 
+def less_or_close_array(a, b, rel_tol=1e-9):
+    # Elementwise less_or_close, matching math.isclose with abs_tol=0
+    a = np.asarray(a)
+    b = np.asarray(b)
+    with np.errstate(invalid='ignore'):
+        return (a <= b) | (np.abs(a - b) <= rel_tol * np.maximum(np.abs(a), np.abs(b)))
+
+
+def isclose_array(a, b, rel_tol=1e-9):
+    # Elementwise math.isclose with abs_tol=0
+    a = np.asarray(a)
+    b = np.asarray(b)
+    with np.errstate(invalid='ignore'):
+        return (a == b) | (np.abs(a - b) <= rel_tol * np.maximum(np.abs(a), np.abs(b)))
+
+
 def neighbor_window(seq, index, count=1):
     if len(seq) < (count + 2):
         raise ValueError("seq must have at least 3 elements to have neighbors")
@@ -54,6 +75,18 @@ def modified_point_list(seq):
     return return_seq
 
 
+def wrapped_ring(points):
+    """Array equivalent of modified_point_list"""
+    arr = np.asarray(points, dtype=np.float64)
+    if len(arr) < 3:
+        raise ValueError("points must have at least 3 elements to have neighbors")
+    if arr.ndim != 2 or arr.shape[1] != 2:
+        raise ValueError("each element in points must have len(2)")
+    if not np.array_equal(arr[0], arr[-1]):
+        raise ValueError("First and last element must match")
+    return np.concatenate((arr, arr[1:2]))
+
+
 def point_window_iter(seq):
     # Iterates over groups of three points, where the input seq
     # has first and last the same, then add a final group with the
@@ -87,6 +120,28 @@ def between_neighbors(pnt1, pnt2, pnt3):
     )
 
 
+def ring_point_data(point_seq):
+    """Offset and between-ness of every point of a wrapped point sequence
+
+    Array equivalent of building a PointData for each window of
+    point_seq, returning (offset, between) arrays of len(point_seq) - 2.
+    """
+    arr = np.asarray(point_seq, dtype=np.float64)
+    left, point, right = arr[:-2], arr[1:-1], arr[2:]
+    outer = right - left
+    to_left = left - point
+    to_point = point - left
+    norm_outer = np.sqrt(outer[:, 0] * outer[:, 0] + outer[:, 1] * outer[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.abs((outer[:, 0] * to_left[:, 1] - outer[:, 1] * to_left[:, 0]) / norm_outer)
+        scalar_proj = (
+            to_point[:, 0] * (outer[:, 0] / norm_outer) +
+            to_point[:, 1] * (outer[:, 1] / norm_outer)
+        )
+    between = less_or_close_array(0, scalar_proj) & less_or_close_array(scalar_proj, norm_outer)
+    return offset, between
+
+
 def points_inline(pnt1, pnt2, pnt3, tolerance, float_tol=1e-9):
     """Check if the middle point lies on the line between 1 and 2 withing tolerance"""
     mid_offset = midpoint_projection_offset(pnt1, pnt2, pnt3)
@@ -106,15 +161,46 @@ def get_radians(pnt1, pnt2, pnt3):
     return np.arccos(np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2)))
 
 
+def orthogonal_limit(tolerance, float_tol=1e-9):
+    """Greatest squared cosine of an angle within tolerance of a right angle
+
+    An angle a is within tolerance when |a - pi / 2| <= tolerance, that is
+    when cos(a) ** 2 <= sin(tolerance) ** 2.
+    """
+    return math.sin(min(tolerance * (1 + float_tol), math.pi / 2)) ** 2
+
+
+def orthogonal_vectors(vec1, vec2, limit):
+    """Mask of the pairs of vectors at a right angle, within the tolerance
+    of limit, see orthogonal_limit
+
+    Compares the squared dot product against the squared lengths, so no
+    arccos, square root or division is needed. Zero length vectors are
+    never orthogonal.
+    """
+    dot = np.einsum('...i,...i->...', vec1, vec2)
+    lengths = np.einsum('...i,...i->...', vec1, vec1) * np.einsum('...i,...i->...', vec2, vec2)
+    return (dot * dot <= limit * lengths) & (lengths > 0)
+
+
+def cross_product(vec1, vec2):
+    """z component of the cross product of arrays of 2d vectors"""
+    return vec1[..., 0] * vec2[..., 1] - vec1[..., 1] * vec2[..., 0]
+
+
+def same_side_vectors(line_vec, vec1, vec2):
+    """Mask of the pairs of vectors pointing to the same side of line_vec"""
+    return cross_product(line_vec, vec1) * cross_product(line_vec, vec2) > 0
+
+
 def orthogonal(pnt1, pnt2, pnt3, tolerance):
-    rad = get_radians(pnt1, pnt2, pnt3)
-    return within_tolerance(rad - (np.pi / 2), tolerance)
+    return bool(orthogonal_vectors(pnt1 - pnt2, pnt3 - pnt2, orthogonal_limit(tolerance)))
 
 
 def same_side(pnt1, line_start, line_end, pnt2):
-    to_base = get_radians(pnt1, line_start, line_end)
-    to_pnt2 = get_radians(pnt1, line_start, pnt2)
-    return to_base > to_pnt2
+    """pnt1 and pnt2 lie to the same side of the line from line_start to
+    line_end, as seen from line_start and line_end"""
+    return bool(same_side_vectors(line_end - line_start, pnt1 - line_start, pnt2 - line_end))
 
 
 def point_data_list(point_seq):
@@ -123,59 +209,232 @@ def point_data_list(point_seq):
         yield PointData(p1, p2, p3)
 
 
+def point_offset_between(left, point, right):
+    """Scalar ring_point_data for a single window of Python floats"""
+    outer_x = right[0] - left[0]
+    outer_y = right[1] - left[1]
+    norm_outer = math.sqrt(outer_x * outer_x + outer_y * outer_y)
+    if norm_outer == 0:
+        return math.nan, False
+    offset = abs((outer_x * (left[1] - point[1]) - outer_y * (left[0] - point[0])) / norm_outer)
+    scalar_proj = (
+        (point[0] - left[0]) * (outer_x / norm_outer) +
+        (point[1] - left[1]) * (outer_y / norm_outer)
+    )
+    return offset, less_or_close(0, scalar_proj) and less_or_close(scalar_proj, norm_outer)
+
+
+def removal_order(centers, offsets, betweens, tolerance):
+    """Yields (index, offset) of each point removed as insignificant, in order
+
+    centers are the points of a ring without the wrapped repeats, with the
+    offset and between-ness of each point against its neighbors. The
+    lowest removable offset goes first, ties going to the first point in
+    the ring, and only the neighbors of a removed point on the same side of
+    the ring start are recalculated, as remove_insignificant always has.
+    A heap of candidates with stale entries skipped keeps this O(n log n).
+
+    offset is the lowest removable offset at that step, the value compared
+    against tolerance. A run with a lower tolerance removes exactly the
+    points before the first offset above it, so one run at the highest
+    tolerance gives the removals of every lower one.
+    """
+    count = len(centers)
+    prev = [i - 1 for i in range(count)]
+    next_ = [i + 1 for i in range(count)]
+    if count:
+        prev[0] = count - 1
+        next_[-1] = 0
+    version = [0] * count
+    heap = [(x, i, 0) for i, (x, btwn) in enumerate(zip(offsets, betweens)) if btwn]
+    heapq.heapify(heap)
+    while heap:
+        next_rmv, index, ver = heap[0]
+        if ver != version[index]:
+            heapq.heappop(heap)
+            continue
+        if not less_or_close(next_rmv, tolerance):
+            break
+
+        # Of all offsets close to the minimum, the first point is removed
+        candidates = []
+        while heap and isclose(heap[0][0], next_rmv):
+            entry = heapq.heappop(heap)
+            if entry[2] == version[entry[1]]:
+                candidates.append(entry)
+        removed = min(candidates, key=lambda entry: entry[1])
+        for entry in candidates:
+            if entry is not removed:
+                heapq.heappush(heap, entry)
+        index = removed[1]
+        yield index, next_rmv
+
+        # Unlink then recalculate neighbors
+        version[index] += 1
+        before, after = prev[index], next_[index]
+        next_[before] = after
+        prev[after] = before
+        neighbors = []
+        if before < index:
+            neighbors.append(before)
+        if after > index:
+            neighbors.append(after)
+        for neighbor in neighbors:
+            version[neighbor] += 1
+            x, btwn = point_offset_between(centers[prev[neighbor]], centers[neighbor], centers[next_[neighbor]])
+            if btwn:
+                heapq.heappush(heap, (x, neighbor, version[neighbor]))
+
+
 def remove_insignificant(point_iter, data_iter, tolerance):
     data_seq = list(data_iter)
     sig_points = list(point_iter)
-    while True:
-        rem_values = [x.offset for x in data_seq if x.between and less_or_close(x.offset, tolerance)]
-        if rem_values:
-            next_rmv = min(rem_values)
-            for index, data in enumerate(data_seq):
-                if data.between and isclose(data.offset, next_rmv):
-                    break
-            # Remove then recalculate neighbors
-            del sig_points[index + 1]
-            del data_seq[index]
-            if index == 0:
-                # Replace last point with new following point
-                sig_points[-1] = sig_points[1]
-            if index == len(data_seq):
-                sig_points[0] = sig_points[index]
-            if index > 0:
-                data_seq[index - 1] = PointData(*neighbor_window(sig_points, index))
-            if index < len(data_seq):
-                data_seq[index] = PointData(*neighbor_window(sig_points, index + 1))
-            if index == len(data_seq):
-                data_seq[index - 1] = PointData(*neighbor_window(sig_points, index))
-        else:
-            break
-    return sig_points
+    centers = [tuple(float(v) for v in pnt) for pnt in sig_points[1:-1]]
+    offsets = [float(x.offset) for x in data_seq]
+    betweens = [bool(x.between) for x in data_seq]
+    removed = {index for index, _ in removal_order(centers, offsets, betweens, tolerance)}
+    kept = [sig_points[i + 1] for i in range(len(data_seq)) if i not in removed]
+    # Wrap so the first and last points keep both their neighbors
+    return kept[-1:] + kept + kept[:1]
+
+
+def remove_insignificant_array(point_seq, tolerance):
+    """Array equivalent of remove_insignificant for a wrapped point array"""
+    offset, between = ring_point_data(point_seq)
+    centers = point_seq[1:-1].tolist()
+    removed = {index for index, _ in removal_order(centers, offset.tolist(), between.tolist(), tolerance)}
+    kept = [i + 1 for i in range(len(centers)) if i not in removed]
+    return point_seq[kept[-1:] + kept + kept[:1]]
 
 
 def significant_points(points, tolerance):
-    point_seq = modified_point_list(points)
-    data_seq = point_data_list(point_seq)
-    return remove_insignificant(point_seq, data_seq, tolerance)
+    return remove_insignificant_array(wrapped_ring(points), tolerance)
+
+
+def sweep_significant_points(points, tolerances):
+    """significant_points for each tolerance, simplifying the ring once
+
+    The removals at the highest tolerance are recorded, and each tolerance
+    keeps the points outside the prefix of them its run would make.
+    """
+    point_seq = wrapped_ring(points)
+    offset, between = ring_point_data(point_seq)
+    centers = point_seq[1:-1].tolist()
+    steps = list(removal_order(centers, offset.tolist(), between.tolist(), max(tolerances)))
+    results = []
+    for tolerance in tolerances:
+        count = next((i for i, (_, x) in enumerate(steps) if not less_or_close(x, tolerance)), len(steps))
+        removed = {index for index, _ in steps[:count]}
+        kept = [i + 1 for i in range(len(centers)) if i not in removed]
+        results.append(point_seq[kept[-1:] + kept + kept[:1]])
+    return results
+
+
+# Names of the prefilter_rings rules, indexed by rule number
+PREFILTER_RULES = ('vertices', 'extent')
+
+
+def prefilter_rings(coords, ring_offsets, min_len=10):
+    """Number of the first rule ruling out a box in each ring, -1 if none do
+
+    Rules only reject rings find_box could never match, so they can be
+    checked before simplifying:
+    vertices: under 4 points cannot simplify to a window of 4 points
+    extent: the middle edge joins two ring points, so it can be no longer
+    than the diagonal of the ring's bounding box
+    """
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)[:ring_offsets[-1]]
+    lengths = np.diff(ring_offsets)
+    rules = np.full(len(lengths), -1)
+    has_points = lengths > 0
+    if np.any(has_points):
+        starts = ring_offsets[:-1][has_points]
+        extent = np.maximum.reduceat(coords, starts) - np.minimum.reduceat(coords, starts)
+        diagonal = np.sqrt(extent[:, 0] * extent[:, 0] + extent[:, 1] * extent[:, 1])
+        # Allow for rounding so no ring find_box would accept is rejected
+        short = diagonal * (1 + 1e-6) < min_len
+        rules[np.flatnonzero(has_points)[short]] = PREFILTER_RULES.index('extent')
+    rules[lengths < 4] = PREFILTER_RULES.index('vertices')
+    return rules
+
+
+def prefilter_ring(points, min_len=10):
+    """Name of the first prefilter rule rejecting the ring, or None"""
+    rule = prefilter_rings(points, [0, len(points)], min_len)[0]
+    return PREFILTER_RULES[rule] if rule >= 0 else None
+
+
+def find_box(sig_points, angle_tolerance, min_len=10, max_len=80):
+    """Index of the first box-like window of significant points, or None
+
+    The window at index i is sig_points[i - 1:i + 3], with its middle edge
+    between sig_points[i] and sig_points[i + 1]. Every window is tested at
+    once, from the edge vectors of the whole ring.
+    """
+    # Under 5 and the box is not possible
+    if len(sig_points) < 5:
+        return None
+
+    edges = np.diff(np.asarray(sig_points, dtype=np.float64), axis=0)
+    # Corner j, at sig_points[j + 1], joins edges j and j + 1
+    corners = orthogonal_vectors(edges[:-1], edges[1:], orthogonal_limit(angle_tolerance))
+    left, mid, right = edges[:-2], edges[1:-1], edges[2:]
+    mid_dist = np.sqrt(np.einsum('ij,ij->i', mid, mid))
+    boxes = (
+        corners[:-1] &
+        corners[1:] &
+        same_side_vectors(mid, -left, right) &
+        less_or_close_array(mid_dist, max_len) &
+        less_or_close_array(min_len, mid_dist)
+    )
+    found = np.flatnonzero(boxes)
+    return int(found[0]) + 1 if len(found) else None
+
 
+def has_box(points, tolerance, angle_tolerance, min_len=10, max_len=80, sig_points=None):
+    if sig_points is None:
+        if prefilter_ring(points, min_len) is not None:
+            return False
+        sig_points = significant_points(points, tolerance)
+    return find_box(sig_points, angle_tolerance, min_len, max_len) is not None
 
-def has_box(points, tolerance, angle_tolerance, min_len=10, max_len=80):
+
+Classification = namedtuple('Classification', ['sig_points', 'has_box', 'window', 'rejected'])
+
+
+def classify_ring(points, tolerance, angle_tolerance, min_len=10, max_len=80, prefilter=True):
+    """Simplify a ring once and search it for a box-like window
+
+    Rings rejected by a prefilter rule are not simplified, and have the
+    rule name as rejected with sig_points of None.
+    """
+    if prefilter:
+        rejected = prefilter_ring(points, min_len)
+        if rejected is not None:
+            return Classification(None, False, None, rejected)
     sig_points = significant_points(points, tolerance)
+    window = find_box(sig_points, angle_tolerance, min_len, max_len)
+    return Classification(sig_points, window is not None, window, None)
 
-    # Under 5 and the box is not possible
-    if len(sig_points) < 5:
-        return False
 
-    for i in range(1, len(sig_points) - 2):
-        p1, p2, p3, p4 = neighbor_window(sig_points, i, count=2)
+def sweep_ring(points, tolerances, angle_tolerances, min_len=10, max_len=80, prefilter=True):
+    """classify_ring for each (tolerance, angle_tolerance) pair
 
-        mid_dist = distance(p2, p3)
-        if (orthogonal(p1, p2, p3, angle_tolerance) and
-                orthogonal(p2, p3, p4, angle_tolerance) and
-                same_side(p1, p2, p3, p4) and
-                less_or_close(mid_dist, max_len) and
-                less_or_close(min_len, mid_dist)):
-            return True
-    return False
+    Results are in the order of itertools.product(tolerances,
+    angle_tolerances). The ring is simplified once for all tolerances.
+    """
+    count = len(tolerances) * len(angle_tolerances)
+    if prefilter:
+        rejected = prefilter_ring(points, min_len)
+        if rejected is not None:
+            return [Classification(None, False, None, rejected)] * count
+    results = []
+    for sig_points in sweep_significant_points(points, tolerances):
+        for angle_tolerance in angle_tolerances:
+            window = find_box(sig_points, angle_tolerance, min_len, max_len)
+            results.append(Classification(sig_points, window is not None, window, None))
+    return results
 
 
 def distance(pnt1, pnt2):
@@ -192,22 +451,32 @@ def centroid(points):
     return np.asarray((sum_x / length, sum_y / length))
 
 
-def nearest_distances(points, num_nearest=1):
-    if num_nearest < 1:
-        ValueError("num_nearest must be at least 1")
-    if len(points) <= num_nearest:
-        ValueError("num_nearest cannot be larges than len(points) - 1")
+def nearest_distances(points, num_nearest=1, indexes=None, memory_budget=None, directory=None, max_distance=np.inf):
+    """Distances and indexes of the num_nearest nearest other points
 
-    arr = np.array(points)
-    tree = scipy.spatial.KDTree(arr)
-    res = tree.query(tree.data, num_nearest + 1)
-    # Return {
-    #   [p_x, p_y].tobytes() : [dist_first_nearest, dist_sec_nearest, ..., dist_nth_nearest]
-    # }  tobytes used as bytestring is hashable
-    return {
-        point.astype(np.float).tobytes(): dist[1:]
-        for point, dist in zip(tree.data, res[0])
-    }
+    Returns (distances, neighbors) arrays of shape (len(indexes),
+    num_nearest), in the order of indexes, every point by default. A
+    point is never its own neighbor, though a duplicate of it at distance
+    0 can be. Missing neighbors, when there are no more than num_nearest
+    points or none within max_distance, have a distance of inf and an
+    index of len(points).
+
+    When a single tree over points would take more than memory_budget
+    bytes, the query runs in tiles with the results in memmaps under
+    directory, see tiled_nearest_distances.
+    """
+    if num_nearest < 1:
+        raise ValueError("num_nearest must be at least 1")
+
+    arr = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if memory_budget is not None and query_bytes(len(arr), num_nearest) > memory_budget:
+        return tiled_nearest_distances(arr, num_nearest, indexes, memory_budget, directory, max_distance)
+    indexes = np.arange(len(arr)) if indexes is None else np.asarray(indexes, dtype=np.int64)
+    if not len(indexes):
+        return np.empty((0, num_nearest)), np.empty((0, num_nearest), dtype=np.int64)
+    tree = scipy.spatial.cKDTree(arr)
+    distances, neighbors = tree.query(arr[indexes], num_nearest + 1, distance_upper_bound=max_distance, workers=-1)
+    return drop_self(distances, neighbors, indexes)
 
 
 def split_list(original, split_indexes):
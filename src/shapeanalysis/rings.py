@@ -0,0 +1,111 @@
+import numpy as np
+
+# Centroid definitions ring_centroids can compute
+CENTROIDS = ('vertex', 'area')
+
+
+def _segment_sums(values, ring_offsets):
+    """Sum of values over each ring, 0 for rings without points"""
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    lengths = np.diff(ring_offsets)
+    sums = np.zeros((len(lengths),) + values.shape[1:])
+    has_points = lengths > 0
+    if np.any(has_points):
+        sums[has_points] = np.add.reduceat(values[:ring_offsets[-1]], ring_offsets[:-1][has_points])
+    return sums
+
+
+def ring_bboxes(coords, ring_offsets):
+    """(xmin, ymin, xmax, ymax) of each ring, nan for rings without points"""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    lengths = np.diff(ring_offsets)
+    bboxes = np.full((len(lengths), 4), np.nan)
+    has_points = lengths > 0
+    if np.any(has_points):
+        starts = ring_offsets[:-1][has_points]
+        bboxes[has_points, :2] = np.minimum.reduceat(coords[:ring_offsets[-1]], starts)
+        bboxes[has_points, 2:] = np.maximum.reduceat(coords[:ring_offsets[-1]], starts)
+    return bboxes
+
+
+def ring_vertex_centroids(coords, ring_offsets):
+    """centroid of each ring, the mean of its points
+
+    As with centroid, a closing point equal to the first is left out. Rings
+    without points have a centroid of nan.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    lengths = np.diff(ring_offsets)
+    has_points = lengths > 0
+    closed = np.zeros(len(lengths), dtype=bool)
+    firsts = ring_offsets[:-1][has_points]
+    lasts = ring_offsets[1:][has_points] - 1
+    closed[has_points] = np.all(coords[firsts] == coords[lasts], axis=1)
+
+    # Zero the closing points rather than splitting the rings around them
+    weights = np.ones(len(coords))
+    weights[ring_offsets[1:][closed] - 1] = 0
+    sums = _segment_sums(coords * weights[:, None], ring_offsets)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / (lengths - closed)[:, None]
+
+
+def _shoelace_terms(coords, ring_offsets):
+    """Cross product and summed ends of every edge of each ring, relative to
+    its first point, with an edge from the last point back to the first
+
+    The closing edge is empty for a ring ending at its first point, and
+    cancels the duplicated edge of a wrapped ring, see wrapped_ring.
+    """
+    lengths = np.diff(ring_offsets)
+    origins = np.repeat(coords[ring_offsets[:-1][lengths > 0]], lengths[lengths > 0], axis=0)
+    local = coords[:ring_offsets[-1]] - origins
+    following = np.roll(local, -1, axis=0)
+    # The point after the last of a ring is its first, at the local origin
+    following[ring_offsets[1:][lengths > 0] - 1] = 0
+    cross = local[:, 0] * following[:, 1] - following[:, 0] * local[:, 1]
+    return cross, local + following
+
+
+def ring_signed_areas(coords, ring_offsets):
+    """Shoelace area of each ring, positive when counterclockwise"""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    cross, _ = _shoelace_terms(coords, ring_offsets)
+    return _segment_sums(cross, ring_offsets) / 2
+
+
+def ring_area_centroids(coords, ring_offsets):
+    """Centroid of the area enclosed by each ring
+
+    Rings enclosing no area, such as ones with fewer than three points,
+    fall back to their vertex centroid.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    cross, ends = _shoelace_terms(coords, ring_offsets)
+    areas = _segment_sums(cross, ring_offsets) / 2
+    moments = _segment_sums(ends * cross[:, None], ring_offsets)
+    lengths = np.diff(ring_offsets)
+    origins = np.full((len(lengths), 2), np.nan)
+    origins[lengths > 0] = coords[ring_offsets[:-1][lengths > 0]]
+
+    centroids = ring_vertex_centroids(coords, ring_offsets)
+    has_area = areas != 0
+    centroids[has_area] = origins[has_area] + moments[has_area] / (6 * areas[has_area, None])
+    return centroids
+
+
+def ring_centroids(store, method='vertex'):
+    """(len(store), 2) array of the centroid of each ring in a store
+
+    method is one of CENTROIDS, 'vertex' for the mean of the points as
+    centroid gives, or 'area' for the centroid of the enclosed area.
+    """
+    if method == 'vertex':
+        return ring_vertex_centroids(store.coords, store.ring_offsets)
+    if method == 'area':
+        return ring_area_centroids(store.coords, store.ring_offsets)
+    raise ValueError(f'Unknown centroid method: {method!r}')
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+
+# Shape types sharing the polygon record layout (Polygon, PolygonZ, PolygonM)
+POLYGON_TYPES = (5, 15, 25)
+NULL_SHAPE = 0
+
+HEADER_LENGTH = 100
+# Byte offsets of fields within a record, measured from the record header
+SHAPE_TYPE_OFFSET = 8
+BBOX_OFFSET = 12
+NUM_PARTS_OFFSET = 44
+NUM_POINTS_OFFSET = 48
+PARTS_OFFSET = 52
+
+
+def ragged_indexes(starts, counts):
+    """Flat indexes covering [start, start + count) for each start/count pair"""
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum(), dtype=np.int64)
+
+
+class GeometryReader:
+    """Memory-mapped reader for the polygon geometry of a .shp/.shx pair
+
+    Record geometry is exposed as views directly into the mapped file, so
+    no Python object is created per vertex. Attribute (.dbf) data is not
+    read, use pyshp for that.
+    """
+
+    def __init__(self, filename):
+        base = os.path.splitext(filename)[0]
+        self.shp = np.memmap(base + '.shp', dtype=np.uint8, mode='r')
+        shx = np.memmap(base + '.shx', dtype=np.uint8, mode='r')
+
+        self.shape_type = int(self._read_int32(np.array([32]))[0])
+        if self.shape_type not in POLYGON_TYPES:
+            raise ValueError(f'Unsupported shape type: {self.shape_type}')
+
+        # Index records are big-endian (offset, content length) in 16-bit words
+        index = shx[HEADER_LENGTH:].view('>i4').reshape(-1, 2)
+        self.offsets = index[:, 0].astype(np.int64) * 2
+
+        types = self._read_int32(self.offsets + SHAPE_TYPE_OFFSET)
+        if not np.all((types == self.shape_type) | (types == NULL_SHAPE)):
+            raise ValueError('All records must share the file shape type')
+        # Null shape records end after their type, so only the others are read
+        has_shape = types != NULL_SHAPE
+        self.num_parts = np.zeros(len(self.offsets), dtype=np.int64)
+        self.num_points = np.zeros(len(self.offsets), dtype=np.int64)
+        self.num_parts[has_shape] = self._read_int32(self.offsets[has_shape] + NUM_PARTS_OFFSET)
+        self.num_points[has_shape] = self._read_int32(self.offsets[has_shape] + NUM_POINTS_OFFSET)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _read_int32(self, byte_offsets):
+        byte_offsets = np.asarray(byte_offsets, dtype=np.int64)
+        raw = self.shp[byte_offsets[:, None] + np.arange(4)]
+        return raw.view('<i4').ravel().astype(np.int64)
+
+    def _points_offsets(self, records):
+        return self.offsets[records] + PARTS_OFFSET + 4 * self.num_parts[records]
+
+    def parts(self, index):
+        """Start index of each part of the record"""
+        start = self.offsets[index] + PARTS_OFFSET
+        return self.shp[start:start + 4 * self.num_parts[index]].view('<i4')
+
+    def points(self, index):
+        """Zero-copy (n, 2) view of the record's points"""
+        start = self._points_offsets(index)
+        return self.shp[start:start + 16 * self.num_points[index]].view('<f8').reshape(-1, 2)
+
+    def bboxes(self, records=None):
+        """(xmin, ymin, xmax, ymax) of each record, nan for null shapes"""
+        records = np.arange(len(self)) if records is None else np.asarray(records)
+        has_points = self.num_points[records] > 0
+        bboxes = np.full((len(records), 4), np.nan)
+        starts = self.offsets[records[has_points]] + BBOX_OFFSET
+        raw = self.shp[ragged_indexes(starts, np.full(len(starts), 32))]
+        bboxes[has_points] = raw.view('<f8').reshape(-1, 4)
+        return bboxes
+
+    def read(self, records=None):
+        """Gather the geometry of records into flat buffers
+
+        Returns (coords, record_offsets, part_offsets) where coords is a
+        float64 (N, 2) array, part_offsets[i]:part_offsets[i + 1] is the
+        vertex range of part i and record_offsets[j]:record_offsets[j + 1]
+        is the part range of record j.
+        """
+        records = np.arange(len(self)) if records is None else np.asarray(records, dtype=np.int64)
+        num_parts = self.num_parts[records]
+        num_points = self.num_points[records]
+
+        record_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(num_parts, out=record_offsets[1:])
+        vertex_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(num_points, out=vertex_offsets[1:])
+
+        # Part starts are stored relative to their record
+        part_bytes = ragged_indexes(self.offsets[records] + PARTS_OFFSET, 4 * num_parts)
+        parts = self.shp[part_bytes].view('<i4').astype(np.int64)
+        part_offsets = np.empty(len(parts) + 1, dtype=np.int64)
+        part_offsets[:-1] = parts + np.repeat(vertex_offsets[:-1], num_parts)
+        part_offsets[-1] = vertex_offsets[-1]
+
+        # Points are not 8-byte aligned within the file, so gather through a
+        # float64 view for each possible 2-byte shift of the start
+        coords = np.empty((vertex_offsets[-1], 2), dtype=np.float64)
+        flat = coords.reshape(-1)
+        starts = self._points_offsets(records)
+        for shift in range(0, 8, 2):
+            selected = (starts % 8) == shift
+            if not np.any(selected):
+                continue
+            view = self.shp[shift:shift + 8 * ((len(self.shp) - shift) // 8)].view('<f8')
+            source = ragged_indexes((starts[selected] - shift) // 8, 2 * num_points[selected])
+            target = ragged_indexes(2 * vertex_offsets[:-1][selected], 2 * num_points[selected])
+            flat[target] = view[source]
+        return coords, record_offsets, part_offsets
@@ -0,0 +1,177 @@
+import itertools
+import random
+
+import numpy as np
+import shapefile
+
+from shapeanalysis.shapereader import GeometryReader, ragged_indexes
+
+
+class PolygonStore:
+    """Columnar store of polygon rings
+
+    Ring i has points coords[ring_offsets[i]:ring_offsets[i + 1]] and
+    belongs to the record with pid pids[ring_records[i]].
+    """
+
+    def __init__(self, coords, ring_offsets, ring_records, pids):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.ring_records = np.asarray(ring_records, dtype=np.int64)
+        self.pids = np.asarray(pids, dtype=object)
+        if len(self.ring_offsets) != len(self.ring_records) + 1:
+            raise ValueError("ring_offsets must have one more element than ring_records")
+
+    def __len__(self):
+        return len(self.ring_records)
+
+    def __iter__(self):
+        # Yields (pid, points) for each ring
+        return zip(self.ring_pids, self.rings())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            stop = max(start, stop)
+            offsets = self.ring_offsets[start:stop + 1]
+            return PolygonStore(
+                self.coords[offsets[0]:offsets[-1]],
+                offsets - offsets[0],
+                self.ring_records[start:stop],
+                self.pids,
+            )
+        return self.ring(key)
+
+    @property
+    def ring_pids(self):
+        return self.pids[self.ring_records]
+
+    @property
+    def ring_lengths(self):
+        return np.diff(self.ring_offsets)
+
+    @property
+    def ring_parts(self):
+        """Index of each ring among the rings of its record
+
+        Rings of a record are expected to be contiguous, as read_stores
+        produces them, so this is the part number of the ring in the
+        shapefile for a store holding whole records.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        starts = np.flatnonzero(np.diff(self.ring_records, prepend=self.ring_records[0] - 1))
+        counts = np.diff(np.append(starts, len(self)))
+        return np.arange(len(self)) - np.repeat(starts, counts)
+
+    def ring(self, index):
+        if index < 0:
+            index += len(self)
+        return self.coords[self.ring_offsets[index]:self.ring_offsets[index + 1]]
+
+    def rings(self):
+        for i in range(len(self)):
+            yield self.coords[self.ring_offsets[i]:self.ring_offsets[i + 1]]
+
+    def take(self, indexes):
+        """New store holding only the rings at indexes"""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        lengths = self.ring_lengths[indexes]
+        offsets = np.zeros(len(indexes) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        coords = self.coords[ragged_indexes(self.ring_offsets[:-1][indexes], lengths)]
+        return PolygonStore(coords, offsets, self.ring_records[indexes], self.pids)
+
+    def filter(self, mask):
+        """New store holding only the rings where mask is True"""
+        return self.take(np.flatnonzero(mask))
+
+    def chunks(self, size):
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+    @classmethod
+    def from_rings(cls, rings):
+        """Build a store from an iterable of (pid, points)"""
+        pids = []
+        lengths = []
+        coords = []
+        for pid, points in rings:
+            points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            pids.append(pid)
+            lengths.append(len(points))
+            coords.append(points)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        coords = np.concatenate(coords) if coords else np.empty((0, 2))
+        return cls(coords, offsets, np.arange(len(pids)), pids)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """Join stores end to end into a new store"""
+        stores = list(stores)
+        if not stores:
+            return cls(np.empty((0, 2)), [0], [], [])
+        vertex_starts = np.cumsum([0] + [len(store.coords) for store in stores])
+        record_starts = np.cumsum([0] + [len(store.pids) for store in stores])
+        ring_offsets = [stores[0].ring_offsets[:1]]
+        for store, start in zip(stores, vertex_starts):
+            ring_offsets.append(store.ring_offsets[1:] + start)
+        return cls(
+            np.concatenate([store.coords for store in stores]),
+            np.concatenate(ring_offsets),
+            np.concatenate([store.ring_records + start for store, start in zip(stores, record_starts)]),
+            np.concatenate([store.pids for store in stores]),
+        )
+
+    @classmethod
+    def from_reader(cls, reader, pids, records=None):
+        """Build a store from a GeometryReader, one pid per record read"""
+        coords, record_offsets, part_offsets = reader.read(records)
+        ring_records = np.repeat(np.arange(len(record_offsets) - 1), np.diff(record_offsets))
+        return cls(coords, part_offsets, ring_records, pids)
+
+
+def select_records(count, offset=0, limit=None, sample_fraction=None, seed=None):
+    """Yields the record indexes to read, in file order
+
+    Records from offset on are kept with probability sample_fraction,
+    stopping once limit records have been selected.
+    """
+    records = range(offset, count)
+    if sample_fraction is not None:
+        rng = random.Random(seed)
+        records = (i for i in records if rng.random() < sample_fraction)
+    return itertools.islice(records, limit)
+
+
+def read_stores(filename, chunk_size=10000, records=None):
+    """Yields a PolygonStore for each chunk of records in the shapefile
+
+    Only the given record indexes are read, all of them by default. The
+    pid of a record is the value of its first attribute field.
+    """
+    reader = GeometryReader(filename)
+    records = iter(range(len(reader)) if records is None else records)
+    with shapefile.Reader(filename) as sf:
+        pid_field = sf.fields[1][0]
+        while True:
+            chunk = np.fromiter(itertools.islice(records, chunk_size), dtype=np.int64)
+            if not len(chunk):
+                break
+            pids = [sf.record(i, fields=[pid_field])[0] for i in chunk.tolist()]
+            yield PolygonStore.from_reader(reader, pids, chunk)
+
+
+def pid_type(filename):
+    """SQLite column type for the pid field of a shapefile"""
+    with shapefile.Reader(filename) as sf:
+        field = sf.fields[1]
+    field_type, decimal = field[1], field[3]
+    if field_type == 'N' and not decimal:
+        return 'integer'
+    if field_type in ('N', 'F'):
+        return 'real'
+    return 'text'
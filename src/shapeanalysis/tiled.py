@@ -0,0 +1,131 @@
+import math
+import tempfile
+
+import numpy as np
+import scipy.spatial
+
+# Rough bytes held per point by a tree and its query, before the results
+TREE_BYTES_PER_POINT = 64
+
+
+def query_bytes(num_points, num_nearest):
+    """Estimated memory to build a tree over num_points and query all of them"""
+    return num_points * (TREE_BYTES_PER_POINT + 16 * (num_nearest + 1))
+
+
+def drop_self(distances, neighbors, indexes):
+    """Remove each point from its own k + 1 query results
+
+    Where duplicates at distance 0 crowd a point out of its results, the
+    farthest result is dropped instead.
+    """
+    is_self = neighbors == np.asarray(indexes)[:, None]
+    is_self[~is_self.any(axis=1), -1] = True
+    keep = ~is_self
+    shape = (len(distances), distances.shape[1] - 1)
+    return distances[keep].reshape(shape), neighbors[keep].reshape(shape)
+
+
+class Grid:
+    """Regular grid of tiles over the bounding box of points
+
+    Cell (ix, iy) is numbered iy * columns + ix.
+    """
+
+    def __init__(self, points, tiles):
+        self.low = points.min(axis=0)
+        high = points.max(axis=0)
+        extent = np.maximum(high - self.low, np.finfo(np.float64).tiny)
+        self.columns = max(1, min(tiles, math.ceil(math.sqrt(tiles * extent[0] / extent[1]))))
+        self.rows = max(1, math.ceil(tiles / self.columns))
+        self.size = extent / (self.columns, self.rows)
+        # Points are binned with rounding, so keep a margin from every edge
+        self.slack = 1e-9 * max(np.abs(self.low).max(), np.abs(high).max(), self.size.max())
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def cells(self, points):
+        ix = np.clip(np.floor((points[:, 0] - self.low[0]) / self.size[0]), 0, self.columns - 1)
+        iy = np.clip(np.floor((points[:, 1] - self.low[1]) / self.size[1]), 0, self.rows - 1)
+        return iy.astype(np.int64) * self.columns + ix.astype(np.int64)
+
+    def margins(self, points, x0, x1, y0, y1):
+        """Distance from points to the edge of cells x0..x1 by y0..y1
+
+        Edges on the border of the grid have nothing beyond them, so they
+        are infinitely far.
+        """
+        inf = np.inf
+        left = self.low[0] + x0 * self.size[0] if x0 > 0 else -inf
+        right = self.low[0] + (x1 + 1) * self.size[0] if x1 < self.columns - 1 else inf
+        bottom = self.low[1] + y0 * self.size[1] if y0 > 0 else -inf
+        top = self.low[1] + (y1 + 1) * self.size[1] if y1 < self.rows - 1 else inf
+        margins = np.minimum.reduce([
+            points[:, 0] - left,
+            right - points[:, 0],
+            points[:, 1] - bottom,
+            top - points[:, 1],
+        ])
+        return margins - self.slack
+
+
+def tiled_nearest_distances(points, num_nearest=1, indexes=None, memory_budget=2 ** 30, directory=None, max_distance=np.inf):
+    """nearest_distances in tiles, within roughly memory_budget bytes
+
+    Points are binned into a grid of tiles sized so a tile and its halo,
+    the ring of tiles around it, fit the budget. Each tile queries a tree
+    over itself and its halo. Points whose k-th distance reaches past the
+    halo, with the halo edge within max_distance, are queried again with a
+    wider halo, so the distances match a single tree exactly. Only a tie
+    at the k-th distance can give a different neighbor.
+
+    The results are memmaps of temporary files in directory, streamed to
+    as each tile completes.
+    """
+    arr = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(arr)
+    indexes = np.arange(count) if indexes is None else np.asarray(indexes, dtype=np.int64)
+    shape = (len(indexes), num_nearest)
+    if not len(indexes):
+        return np.empty(shape), np.empty(shape, dtype=np.int64)
+    distances = np.memmap(tempfile.TemporaryFile(dir=directory), dtype=np.float64, mode='w+', shape=shape)
+    neighbors = np.memmap(tempfile.TemporaryFile(dir=directory), dtype=np.int64, mode='w+', shape=shape)
+
+    # A tile with its halo of 8 tiles should fit the budget
+    tile_points = max(num_nearest + 1, memory_budget // (9 * query_bytes(1, num_nearest)))
+    grid = Grid(arr, math.ceil(count / tile_points))
+    cells = grid.cells(arr)
+    order = np.argsort(cells, kind='stable')
+    starts = np.searchsorted(cells[order], np.arange(len(grid) + 1))
+    query_cells = cells[indexes]
+    query_order = np.argsort(query_cells, kind='stable')
+    query_starts = np.searchsorted(query_cells[query_order], np.arange(len(grid) + 1))
+    del cells, query_cells
+
+    sentinel = np.array([count])
+    for cell in np.flatnonzero(np.diff(query_starts)).tolist():
+        pending = query_order[query_starts[cell]:query_starts[cell + 1]]
+        cx, cy = cell % grid.columns, cell // grid.columns
+        radius = 1
+        while len(pending):
+            x0, x1 = max(cx - radius, 0), min(cx + radius, grid.columns - 1)
+            y0, y1 = max(cy - radius, 0), min(cy + radius, grid.rows - 1)
+            # The cells of each grid row are contiguous in order
+            candidates = np.concatenate([
+                order[starts[y * grid.columns + x0]:starts[y * grid.columns + x1 + 1]]
+                for y in range(y0, y1 + 1)
+            ])
+            query_points = arr[indexes[pending]]
+            tree = scipy.spatial.cKDTree(arr[candidates])
+            dists, near = tree.query(query_points, num_nearest + 1, distance_upper_bound=max_distance, workers=-1)
+            near = np.concatenate((candidates, sentinel))[near.reshape(len(pending), -1)]
+            dists, near = drop_self(dists.reshape(len(pending), -1), near, indexes[pending])
+
+            margins = grid.margins(query_points, x0, x1, y0, y1)
+            done = (dists[:, -1] <= margins) | (margins > max_distance)
+            distances[pending[done]] = dists[done]
+            neighbors[pending[done]] = near[done]
+            pending = pending[~done]
+            radius += 1
+    return distances, neighbors
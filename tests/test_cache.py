@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestRingKey(unittest.TestCase):
+
+    def test_ring_key(self):
+        import numpy as np
+        from shapeanalysis.cache import ring_key
+
+        points = [(0, 0), (0, 1), (1, 1), (0, 0)]
+        self.assertEqual(ring_key(points, 0.6, 0.03), ring_key(np.asarray(points, dtype=np.float64), 0.6, 0.03))
+        self.assertNotEqual(ring_key(points, 0.6, 0.03), ring_key(points, 0.6, 0.04))
+        self.assertNotEqual(ring_key(points, 0.6, 0.03), ring_key(points[::-1], 0.6, 0.03))
+
+
+class TestClassificationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_lookup_missing(self):
+        from shapeanalysis.cache import ClassificationCache
+
+        with ClassificationCache(self.path) as cache:
+            self.assertEqual([None, None], cache.lookup([b'a', b'b']))
+            self.assertEqual((0, 2), (cache.hits, cache.misses))
+
+    def test_lookup_duplicate_keys(self):
+        from shapeanalysis.cache import ClassificationCache
+        from shapeanalysis.process_data import Classification
+
+        with ClassificationCache(self.path) as cache:
+            cache.add([b'a'], [Classification(None, False, None, 'extent')])
+            actual = cache.lookup([b'a', b'b', b'a', b'b', b'a'])
+            self.assertEqual((3, 2), (cache.hits, cache.misses))
+        self.assertEqual([True, False, True, False, True], [result is not None for result in actual])
+
+    def test_add_lookup(self):
+        import numpy as np
+        from shapeanalysis.cache import ClassificationCache
+        from shapeanalysis.process_data import Classification
+
+        sig_points = np.asarray([(0, 0), (0, 20), (20, 20), (20, 0), (0, 0), (0, 20)], dtype=np.float64)
+        results = [
+            Classification(sig_points, True, 2, None),
+            Classification(None, False, None, 'extent'),
+            Classification(None, False, None, None),
+        ]
+        with ClassificationCache(self.path) as cache:
+            cache.add([b'a', b'b', b'c'], results)
+        with ClassificationCache(self.path) as cache:
+            actual = cache.lookup([b'c', b'a', b'd', b'b'])
+            self.assertEqual((3, 1), (cache.hits, cache.misses))
+
+        self.assertEqual(results[2], actual[0])
+        self.assertTrue(np.array_equal(sig_points, actual[1].sig_points))
+        self.assertEqual((True, 2, None), actual[1][1:])
+        self.assertIsNone(actual[2])
+        self.assertEqual(results[1], actual[3])
+
+    def test_evict_least_recently_used(self):
+        from shapeanalysis.cache import ClassificationCache
+        from shapeanalysis.process_data import Classification
+
+        result = Classification(None, False, None, None)
+        with ClassificationCache(self.path, max_entries=2) as cache:
+            cache.add([b'a'], [result])
+            cache.add([b'b'], [result])
+            cache.add([b'c'], [result])
+            cache.lookup([b'a'])
+        with ClassificationCache(self.path) as cache:
+            actual = cache.lookup([b'a', b'b', b'c'])
+        self.assertEqual([True, False, True], [x is not None for x in actual])
@@ -0,0 +1,246 @@
+import unittest
+
+
+class TestInsertBatches(unittest.TestCase):
+
+    def test_insert_main_generator(self):
+        import shapeanalysis.database as database
+
+        conn = database.connection(':memory:', bulk=True)
+        database.create_database(conn, 3)
+        rows = ((pid, 0, 1.0, 2.0, 3.0, pid, -pid) for pid in range(25))
+        with self.assertLogs('shapeanalysis.database', 'INFO') as logs:
+            self.assertEqual(25, database.insert_main(conn, rows, 3, batch_size=10))
+        self.assertIn('Wrote 25 rows to main', logs.output[0])
+        self.assertIn('rows/s', logs.output[0])
+        self.assertEqual([(25, 300)], conn.execute("""select count(*), sum(pid) from main""").fetchall())
+        self.assertEqual(3, database.main_nearest_count(conn))
+
+    def test_insert_empty(self):
+        import shapeanalysis.database as database
+
+        conn = database.connection(':memory:')
+        database.create_database(conn)
+        self.assertEqual(0, database.insert_main(conn, iter([])))
+
+    def test_bulk_pragmas(self):
+        import os
+        import shutil
+        import tempfile
+        import shapeanalysis.database as database
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            conn = database.connection(os.path.join(tempdir, 'output.db'), bulk=True)
+            self.assertEqual('memory', conn.execute("""pragma journal_mode""").fetchone()[0])
+            self.assertEqual(0, conn.execute("""pragma synchronous""").fetchone()[0])
+            conn.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        import shapeanalysis.database as database
+
+        self.conn = database.connection(':memory:')
+        database.create_database(self.conn, 2, 'text')
+        database.insert_main(self.conn, [
+            ('a', 0, 1.0, 2.0, 5.0, 5.0),
+            ('a', 1, 1.0, 2.0, 50.0, 50.0),
+            ('b', 0, 3.0, 4.0, 100.0, 100.0),
+        ])
+        database.insert_parcels(self.conn, [
+            ('a', b'1', 0.0, 0.0, 60.0, 60.0),
+            ('b', b'2', 90.0, 90.0, 110.0, 110.0),
+            ('c', b'3', None, None, None, None),
+        ])
+        database.create_indexes(self.conn)
+
+    def test_main_upsert(self):
+        import shapeanalysis.database as database
+
+        database.insert_main(self.conn, [('a', 1, 7.0, 8.0, 50.0, 50.0)])
+        self.assertEqual(
+            [(1, 'a', 1, 7.0, 8.0, 50.0, 50.0)],
+            self.conn.execute("""select * from main where pid = 'a' and part = 1""").fetchall(),
+        )
+        self.assertEqual(3, self.conn.execute("""select count(*) from main""").fetchone()[0])
+
+    def test_select_extent(self):
+        import shapeanalysis.database as database
+
+        actual = database.select_extent(self.conn, 55, 55, 95, 95)
+        self.assertEqual([('a', 0), ('a', 1), ('b', 0)], [row[1:3] for row in actual])
+        actual = database.select_extent(self.conn, 100, 100, 200, 200)
+        self.assertEqual([('b', 0)], [row[1:3] for row in actual])
+        self.assertEqual([], database.select_extent(self.conn, 200, 200, 300, 300))
+
+    def test_delete_parcels(self):
+        import shapeanalysis.database as database
+
+        database.delete_parcels(self.conn, ['b'])
+        self.assertEqual({'a': b'1', 'c': b'3'}, database.select_parcels(self.conn))
+        self.assertEqual(1, self.conn.execute("""select count(*) from parcel_bbox""").fetchone()[0])
+
+
+class TestRuns(unittest.TestCase):
+
+    def write_run(self, conn, name, pids, num_nearest=2):
+        import shapeanalysis.database as database
+
+        database.create_database(conn, num_nearest, 'text', replace=False)
+        run = database.start_run(conn, 'parcels.shp', {'inline_tolerance': 0.6}, name)
+        count = database.insert_main(conn, ((pid, 0, 1.0, 2.0, 0.0, 0.0) for pid in pids), num_nearest, run=run)
+        database.insert_parcels(conn, ((pid, b'', 0.0, 0.0, 1.0, 1.0) for pid in pids), run=run)
+        database.create_indexes(conn, run=run)
+        database.finish_run(conn, run, count)
+        return run
+
+    def test_runs_share_database(self):
+        import json
+        import shapeanalysis.database as database
+
+        conn = database.connection(':memory:', shared=True)
+        first = self.write_run(conn, 'county a', ['a', 'b'])
+        second = self.write_run(conn, None, ['a', 'c', 'd'])
+        self.assertNotEqual(first, second)
+        self.assertEqual(
+            [(first, 2), (second, 3)],
+            conn.execute("""select run, count(*) from main group by run""").fetchall(),
+        )
+        name, parameters, row_count, finished = conn.execute(
+            """select name, parameters, row_count, finished >= started from runs where id = ?""", (first,)
+        ).fetchone()
+        self.assertEqual(('county a', 2, 1), (name, row_count, finished))
+        self.assertEqual({'inline_tolerance': 0.6}, json.loads(parameters))
+        self.assertEqual(5, len(database.select_extent(conn, 0, 0, 1, 1)))
+        self.assertEqual(2, len(database.select_extent(conn, 0, 0, 1, 1, first)))
+        self.assertEqual(second, database.find_run(conn))
+        self.assertEqual(first, database.find_run(conn, 'county a'))
+
+    def test_repeated_name_replaces_run(self):
+        import shapeanalysis.database as database
+
+        conn = database.connection(':memory:')
+        first = self.write_run(conn, 'county a', ['a', 'b'])
+        other = self.write_run(conn, 'county b', ['a'])
+        with self.assertLogs('shapeanalysis.database', 'INFO') as logs:
+            self.assertEqual(first, self.write_run(conn, 'county a', ['c']))
+        self.assertIn("Replacing the rows of run 'county a'", logs.output[0])
+        self.assertEqual(
+            [(first, 'c'), (other, 'a')],
+            conn.execute("""select run, pid from main order by run, pid""").fetchall(),
+        )
+        self.assertEqual({'c': b''}, database.select_parcels(conn, first))
+        self.assertEqual(2, conn.execute("""select count(*) from parcel_bbox""").fetchone()[0])
+
+    def test_clear_run(self):
+        import shapeanalysis.database as database
+
+        conn = database.connection(':memory:')
+        first = self.write_run(conn, 'county a', ['a', 'b'])
+        other = self.write_run(conn, 'county b', ['a'])
+        database.clear_run(conn, first)
+        self.assertEqual([(other,)], conn.execute("""select run from main""").fetchall())
+        self.assertEqual([(other,)], conn.execute("""select run from parcels""").fetchall())
+        self.assertEqual(1, conn.execute("""select count(*) from parcel_bbox""").fetchone()[0])
+        self.assertEqual(first, database.find_run(conn, 'county a'))
+
+    def test_append_checks_nearest_columns(self):
+        import shapeanalysis.database as database
+
+        conn = database.connection(':memory:')
+        self.write_run(conn, None, ['a'])
+        with self.assertRaises(ValueError):
+            database.create_database(conn, 3, replace=False)
+
+
+class TestWriter(unittest.TestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        import shapeanalysis.database as database
+
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'output.db')
+        with database.connection(self.filename) as conn:
+            database.create_database(conn, 1)
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.tempdir)
+
+    def count(self, table):
+        import shapeanalysis.database as database
+
+        conn = database.connection(self.filename)
+        try:
+            return conn.execute(f"""select count(*) from {table}""").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_stream_and_submit(self):
+        import shapeanalysis.database as database
+
+        with database.Writer(lambda: database.connection(self.filename), 1, batch_size=3) as writer:
+            write_parcels = writer.stream(database.insert_parcels)
+            write_rectangles = writer.stream(database.insert_rectangle)
+            # Streams are written to at once, with the writer queue of one
+            for pid in range(10):
+                write_parcels([(pid, b'', 0.0, 0.0, 1.0, 1.0)])
+                write_rectangles([(pid, 0, *[1.0] * 11)])
+            write_parcels(None)
+            write_rectangles(None)
+            writer.submit(database.insert_main, [(0, 0, 1.0, 0.0, 0.0)], 1)
+        self.assertEqual(10, self.count('parcels'))
+        self.assertEqual(10, self.count('rectangle'))
+        self.assertEqual(1, self.count('main'))
+
+    def test_error_rolls_back(self):
+        import shapeanalysis.database as database
+
+        with self.assertRaises(ValueError):
+            with database.Writer(lambda: database.connection(self.filename)) as writer:
+                writer.submit(database.insert_main, [(0, 0, 1.0, 0.0, 0.0)], 1)
+                write_parcels = writer.stream(database.insert_parcels)
+                write_parcels([(0, b'', 0.0, 0.0, 1.0, 1.0)])
+                raise ValueError('classification failed')
+        self.assertEqual(0, self.count('main'))
+
+    def test_write_error_raised(self):
+        import sqlite3
+        import shapeanalysis.database as database
+
+        with self.assertRaises(sqlite3.OperationalError):
+            with database.Writer(lambda: database.connection(self.filename), 1) as writer:
+                writer.submit(database.insert_main, [(0, 0, 1.0, 0.0, 0.0)], 2)
+                for _ in range(10):
+                    writer.submit(database.insert_main, [], 1)
+        self.assertEqual(0, self.count('main'))
+
+    def test_commit_each_releases_lock(self):
+        import sqlite3
+        import time
+        import shapeanalysis.database as database
+
+        with database.Writer(lambda: database.connection(self.filename, shared=True), 1, commit_each=True, batch_size=10) as writer:
+            write_parcels = writer.stream(database.insert_parcels)
+            for pid in range(25):
+                write_parcels([(pid, b'', 0.0, 0.0, 1.0, 1.0)])
+            # Both full batches are committed while the writer waits for rows
+            deadline = time.time() + 10
+            while self.count('parcels') < 20 and time.time() < deadline:
+                time.sleep(0.01)
+            other = sqlite3.connect(self.filename, timeout=0)
+            try:
+                with other:
+                    database.start_run(other, 'other.shp', {})
+            finally:
+                other.close()
+            write_parcels(None)
+        self.assertEqual(25, self.count('parcels'))
@@ -0,0 +1,117 @@
+import unittest
+
+
+def make_store(count=400, seed=0):
+    """Helper to build a store of random star shaped rings"""
+    import numpy as np
+    from shapeanalysis.store import PolygonStore
+
+    rng = np.random.default_rng(seed)
+    rings = []
+    for pid in range(count):
+        center = rng.random(2) * 500
+        angles = np.sort(rng.random(rng.integers(4, 12))) * 2 * np.pi
+        radii = 5 + rng.random(len(angles)) * 10
+        points = np.c_[center[0] + radii * np.cos(angles), center[1] + radii * np.sin(angles)]
+        rings.append((pid, np.vstack([points, points[:1]])))
+    return PolygonStore.from_rings(rings)
+
+
+class TestSegmentDistances(unittest.TestCase):
+
+    def test_segment_distances(self):
+        import numpy as np
+        from shapeanalysis.edges import segment_distances
+
+        a_starts = np.array([(0, 0), (0, 0), (0, 0), (0, 0)], dtype=np.float64)
+        a_ends = np.array([(2, 0), (2, 2), (2, 0), (1, 0)], dtype=np.float64)
+        b_starts = np.array([(1, 1), (0, 2), (3, 0), (1, 3)], dtype=np.float64)
+        b_ends = np.array([(1, 3), (2, 0), (5, 0), (1, 3)], dtype=np.float64)
+        actual = segment_distances(a_starts, a_ends, b_starts, b_ends)
+        self.assertTrue(np.allclose([1, 0, 1, 3], actual))
+
+    def test_ring_distances(self):
+        import numpy as np
+        from shapeanalysis.edges import ring_distances
+        from shapeanalysis.store import PolygonStore
+
+        square = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+        store = PolygonStore.from_rings([
+            (0, [(13, 5), (20, 5), (20, 8), (13, 5)]),
+            (1, [(5, 5), (5, 20), (6, 20), (5, 5)]),
+            (2, [(1, 1)]),
+            (3, [(2, 2), (2, 3), (3, 3), (2, 2)]),
+        ])
+        actual = ring_distances(square, store.coords, store.ring_offsets, [0, 1, 2, 3])
+        self.assertEqual([3, 0, np.inf, 2], actual.tolist())
+
+
+class TestPackedRTree(unittest.TestCase):
+
+    def test_nearest_order(self):
+        import numpy as np
+        from shapeanalysis.edges import PackedRTree, bbox_distances, ring_bboxes
+
+        store = make_store()
+        bboxes = ring_bboxes(store.coords, store.ring_offsets)
+        tree = PackedRTree(bboxes, node_size=4)
+        bbox = np.array([100, 100, 110, 120], dtype=np.float64)
+        actual = list(tree.nearest(bbox))
+        self.assertEqual(sorted(range(len(store))), sorted(item for _, item in actual))
+        bounds = [bound for bound, _ in actual]
+        self.assertEqual(sorted(bounds), bounds)
+        self.assertEqual(sorted(bbox_distances(bbox, bboxes).tolist()), bounds)
+
+    def test_within(self):
+        import numpy as np
+        from shapeanalysis.edges import PackedRTree, bbox_distances, ring_bboxes
+
+        store = make_store()
+        bboxes = ring_bboxes(store.coords, store.ring_offsets)
+        tree = PackedRTree(bboxes, node_size=4)
+        bbox = np.array([200, 300, 200, 300], dtype=np.float64)
+        expected = np.flatnonzero(bbox_distances(bbox, bboxes) <= 40)
+        self.assertEqual(expected.tolist(), sorted(tree.within(bbox, 40).tolist()))
+
+
+class TestPolygonIndex(unittest.TestCase):
+
+    def brute_force(self, store, ids):
+        import numpy as np
+        from shapeanalysis.edges import ring_distances
+
+        rings = np.arange(len(store))
+        distances = np.array([ring_distances(points, store.coords, store.ring_offsets, rings) for points in store.rings()])
+        distances[np.asarray(ids)[:, None] == np.asarray(ids)[None, :]] = np.inf
+        return np.sort(distances, axis=1)
+
+    def test_query_matches_brute_force(self):
+        import numpy as np
+        from shapeanalysis.edges import PolygonIndex
+
+        store = make_store(200)
+        ids = list(range(len(store)))
+        distances, neighbors = PolygonIndex(store, ids, node_size=4).query(store, 3, ids)
+        self.assertTrue(np.array_equal(self.brute_force(store, ids)[:, :3], distances))
+        self.assertFalse(np.any(neighbors == np.arange(len(store))[:, None]))
+
+    def test_query_excludes_ids(self):
+        import numpy as np
+        from shapeanalysis.edges import PolygonIndex
+
+        store = make_store(100)
+        ids = [pid // 2 for pid in range(len(store))]
+        distances, _ = PolygonIndex(store, ids).query(store, 2, ids)
+        self.assertTrue(np.array_equal(self.brute_force(store, ids)[:, :2], distances))
+
+    def test_query_max_distance(self):
+        import numpy as np
+        from shapeanalysis.edges import PolygonIndex
+
+        store = make_store(100)
+        ids = list(range(len(store)))
+        distances, neighbors = PolygonIndex(store, ids).query(store, 2, ids, max_distance=10)
+        expected = self.brute_force(store, ids)[:, :2]
+        expected[expected > 10] = np.inf
+        self.assertTrue(np.array_equal(expected, distances))
+        self.assertTrue(np.all(neighbors[np.isinf(distances)] == len(store)))
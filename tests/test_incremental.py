@@ -0,0 +1,152 @@
+import unittest
+
+
+def make_store(offsets):
+    """Helper to build a store of one 20 by 20 box per pid, placed at offsets[pid]"""
+    from shapeanalysis.store import PolygonStore
+    rings = []
+    for pid, (x, y) in offsets.items():
+        rings.append((pid, [(x, y), (x, y + 20), (x + 20, y + 20), (x + 20, y), (x, y)]))
+    return PolygonStore.from_rings(rings)
+
+
+def run(conn, diff, store):
+    """Helper to classify the changed rings of store and update conn"""
+    from shapeanalysis.incremental import update_database
+    from shapeanalysis.pipeline import classify_matches
+    from shapeanalysis.process_data import centroid
+
+    rectangles = []
+    matches, parts, windows, _ = classify_matches(diff.changed_stores([store]), 0.6, 0.03, on_rectangles=rectangles.extend)
+    update_database(conn, diff, matches, parts, [centroid(points) for points in matches.rings()], windows=windows, rectangles=rectangles)
+
+
+class TestRecordHashes(unittest.TestCase):
+
+    def test_record_hashes(self):
+        from shapeanalysis.incremental import record_hashes
+        from shapeanalysis.store import PolygonStore
+
+        ring = [(0, 0), (0, 1), (1, 1), (0, 0)]
+        store = PolygonStore(ring + ring + ring, [0, 4, 8, 12], [0, 0, 2], ['a', 'b', 'c'])
+        actual = list(record_hashes(store))
+        self.assertEqual([0, 2], [record for record, _, _ in actual])
+        self.assertNotEqual(actual[0][1], actual[1][1])
+        self.assertEqual((0, 0, 1, 1), actual[0][2])
+
+        store = PolygonStore.from_rings([('a', ring), ('b', ring)])
+        first, second = list(record_hashes(store))
+        self.assertEqual(first[1], second[1])
+
+    def test_record_hashes_empty(self):
+        from shapeanalysis.incremental import record_hashes
+        from shapeanalysis.store import PolygonStore
+
+        self.assertEqual([], list(record_hashes(PolygonStore.concatenate([]))))
+
+
+class TestParcelStores(unittest.TestCase):
+
+    def test_parcel_stores(self):
+        from shapeanalysis.incremental import GeometryDiff, parcel_stores
+
+        stores = [make_store({1: (0, 0), 2: (100, 0)}), make_store({3: (200, 0)})]
+        written = []
+        actual = list(parcel_stores(stores, written.append))
+        self.assertEqual(stores, actual)
+        self.assertEqual([[1, 2], [3]], [[row[0] for row in rows] for rows in written])
+
+        diff = GeometryDiff({})
+        list(diff.changed_stores(stores))
+        self.assertEqual(sorted(diff.parcel_rows()), sorted(row for rows in written for row in rows))
+
+    def test_changed_stores(self):
+        from shapeanalysis.incremental import GeometryDiff
+
+        previous = GeometryDiff({})
+        list(previous.changed_stores([make_store({1: (0, 0), 2: (100, 0), 3: (200, 0)})]))
+
+        diff = GeometryDiff(previous.hashes)
+        changed = list(diff.changed_stores([make_store({1: (0, 0), 2: (150, 0), 4: (300, 0)})]))
+        self.assertEqual([2, 4], list(changed[0].ring_pids))
+        self.assertEqual({4}, diff.added)
+        self.assertEqual({2}, diff.modified)
+        self.assertEqual({3}, diff.removed)
+
+
+class TestAffectedPoints(unittest.TestCase):
+
+    def test_affected_points(self):
+        from shapeanalysis.incremental import affected_points
+
+        points = [(0, 0), (10, 0), (100, 0)]
+        actual = affected_points(points, [5, float('nan'), 50], [(3, 0), (200, 0)])
+        self.assertEqual([True, True, False], list(actual))
+
+    def test_affected_points_nothing_moved(self):
+        from shapeanalysis.incremental import affected_points
+
+        actual = affected_points([(0, 0), (10, 0)], [5, float('nan')], [])
+        self.assertEqual([False, True], list(actual))
+
+
+class TestUpdateDatabase(unittest.TestCase):
+
+    def full(self, offsets):
+        import sqlite3
+        import shapeanalysis.database as database
+        from shapeanalysis.incremental import GeometryDiff
+
+        conn = sqlite3.connect(':memory:')
+        database.create_database(conn)
+        diff = GeometryDiff({})
+        run(conn, diff, make_store(offsets))
+        return conn
+
+    def rows(self, conn):
+        return sorted(conn.execute("""select pid, part, nearest1, nearest2, cx, cy from main"""))
+
+    def boxes(self, conn):
+        return sorted(conn.execute("""
+            select pid, parcel_bbox.xmin, parcel_bbox.ymax from parcel_bbox
+            join parcels on parcels.id = parcel_bbox.id
+        """))
+
+    def test_update_matches_full_run(self):
+        import shapeanalysis.database as database
+        from shapeanalysis.incremental import GeometryDiff
+
+        before = {pid: (100 * pid, 0) for pid in range(10)}
+        after = dict(before)
+        after[3] = (310, 0)
+        del after[7]
+        after[12] = (1200, 50)
+
+        conn = self.full(before)
+        diff = GeometryDiff(database.select_parcels(conn))
+        with self.assertLogs('shapeanalysis.incremental', 'INFO') as logs:
+            run(conn, diff, make_store(after))
+        self.assertIn('Parcels added: 1, modified: 1, removed: 1', logs.output[0])
+        self.assertIn('for 7 of 10 centroids', logs.output[1])
+
+        expected = self.full(after)
+        self.assertEqual(self.rows(expected), self.rows(conn))
+        self.assertEqual(database.select_parcels(expected), database.select_parcels(conn))
+        self.assertEqual(self.boxes(expected), self.boxes(conn))
+        rectangles = """select pid, part, area from rectangle order by pid, part"""
+        self.assertEqual(10, len(conn.execute(rectangles).fetchall()))
+        self.assertEqual(expected.execute(rectangles).fetchall(), conn.execute(rectangles).fetchall())
+        boxlike = """select pid, part, mid from boxlike order by pid, part"""
+        self.assertEqual(10, len(conn.execute(boxlike).fetchall()))
+        self.assertEqual(expected.execute(boxlike).fetchall(), conn.execute(boxlike).fetchall())
+
+    def test_update_unchanged(self):
+        import shapeanalysis.database as database
+        from shapeanalysis.incremental import GeometryDiff
+
+        offsets = {pid: (100 * pid, 0) for pid in range(5)}
+        conn = self.full(offsets)
+        expected = self.rows(conn)
+        diff = GeometryDiff(database.select_parcels(conn))
+        run(conn, diff, make_store(offsets))
+        self.assertEqual(expected, self.rows(conn))
@@ -0,0 +1,123 @@
+import unittest
+
+
+class TestRectangleMetrics(unittest.TestCase):
+
+    def test_rectangle(self):
+        import math
+        from shapeanalysis.metrics import rectangle_metrics
+
+        for quad in ([(0, 0), (40, 0), (40, 20), (0, 20)], [(0, 0), (0, 20), (40, 20), (40, 0)]):
+            actual = rectangle_metrics([quad])[0]
+            self.assertEqual(sorted([40, 20, 40, 20]), sorted(actual[0:8:2].tolist()))
+            for angle in actual[1:8:2]:
+                self.assertAlmostEqual(math.pi / 2, angle)
+            self.assertAlmostEqual(0.5, actual[8])
+            self.assertAlmostEqual(0.5, actual[9])
+            self.assertAlmostEqual(800, actual[10])
+
+    def test_matches_get_radians(self):
+        import numpy as np
+        from shapeanalysis.metrics import rectangle_metrics
+        from shapeanalysis.process_data import distance, get_radians
+
+        quads = np.random.default_rng(2).normal(0, 2, (50, 4, 2)) + [(0, 0), (40, 0), (40, 30), (0, 30)]
+        actual = rectangle_metrics(quads)
+        for quad, metrics in zip(quads, actual):
+            expected_sides = [distance(quad[i], quad[(i + 1) % 4]) for i in range(4)]
+            expected_angles = [get_radians(quad[i], quad[(i + 1) % 4], quad[(i + 2) % 4]) for i in range(4)]
+            self.assertTrue(np.allclose(expected_sides, metrics[0:8:2]))
+            self.assertTrue(np.allclose(expected_angles, metrics[1:8:2]))
+            ratios = [min(a, b) / max(a, b) for a, b in zip(expected_sides, np.roll(expected_sides, -1))]
+            self.assertAlmostEqual(min(ratios), metrics[8])
+            self.assertAlmostEqual(max(ratios), metrics[9])
+
+    def test_reflex_corner(self):
+        import math
+        from shapeanalysis.metrics import rectangle_metrics
+
+        actual = rectangle_metrics([[(0, 0), (4, 0), (1, 1), (0, 4)]])[0]
+        self.assertAlmostEqual(2 * math.pi, sum(actual[1:8:2]))
+        self.assertGreater(actual[3], math.pi)
+        self.assertAlmostEqual(4, actual[10])
+
+
+class TestRectangleRows(unittest.TestCase):
+
+    def test_rectangle_rows(self):
+        from shapeanalysis.metrics import rectangle_rows
+        from shapeanalysis.process_data import significant_points
+        from shapeanalysis.store import PolygonStore
+
+        box = [(0, 0), (0, 20), (0, 40), (30, 40), (30, 0), (0, 0)]
+        pentagon = [(0, 0), (0, 40), (15, 50), (30, 40), (30, 0), (0, 0)]
+        matches = PolygonStore.from_rings([
+            ('a', significant_points(box, 0.6)),
+            ('a', significant_points(pentagon, 0.6)),
+            ('a', significant_points(box, 0.6)),
+            ('b', significant_points(pentagon, 0.6)),
+        ])
+        actual = list(rectangle_rows(matches, [0, 1, 2, 0]))
+        self.assertEqual([('a', 0), ('a', 2)], [row[:2] for row in actual])
+        self.assertAlmostEqual(1200, actual[0][-1])
+        self.assertEqual(13, len(actual[0]))
+
+    def test_every_four_sided_ring(self):
+        from shapeanalysis.pipeline import classify_matches
+        from shapeanalysis.store import PolygonStore
+
+        store = PolygonStore.from_rings([
+            ('match', [(0, 0), (0, 30), (40, 30), (40, 0), (0, 0)]),
+            ('large', [(0, 0), (0, 200), (200, 200), (200, 0), (0, 0)]),
+            ('small', [(0, 0), (0, 4), (5, 4), (5, 0), (0, 0)]),
+            ('triangle', [(0, 0), (40, 0), (20, 30), (0, 0)]),
+        ])
+        rows = []
+        matches, _, _, _ = classify_matches(store.chunks(2), 0.6, 0.03, on_rectangles=rows.append)
+        self.assertEqual(['match'], list(matches.ring_pids))
+        self.assertEqual(2, len(rows))
+        actual = {row[0]: row[-1] for chunk in rows for row in chunk}
+        self.assertEqual({'match': 1200, 'large': 40000}, actual)
+
+
+class TestBoxlikeMetrics(unittest.TestCase):
+
+    def test_matches_mid_line_rotation(self):
+        import numpy as np
+        from shapeanalysis.metrics import boxlike_metrics
+        from shapeanalysis.process_data import distance, get_radians, mid_line_rotation
+
+        windows = np.random.default_rng(1).normal(0, 3, (40, 4, 2)) + [(0, 0), (0, 30), (40, 30), (40, 0)]
+        windows[:20] = windows[:20] @ [[0, 1], [-1, 0]]
+        actual = boxlike_metrics(windows)
+        for (p1, p2, p3, p4), metrics in zip(windows, actual):
+            expected = [
+                mid_line_rotation(p2, p3),
+                distance(p1, p2),
+                get_radians(p1, p2, p3),
+                distance(p2, p3),
+                get_radians(p2, p3, p4),
+                distance(p3, p4),
+            ]
+            self.assertTrue(np.allclose(expected, metrics))
+
+    def test_boxlike_rows(self):
+        import math
+        from shapeanalysis.metrics import boxlike_rows
+        from shapeanalysis.pipeline import classify_matches
+        from shapeanalysis.store import PolygonStore
+
+        rings = PolygonStore.from_rings([
+            ('a', [(0, 0), (0, 20), (10, 20), (20, 10), (20, 0), (0, 0)]),
+            ('a', [(0, 0), (15, 0), (0, 15), (0, 0)]),
+            ('a', [(0, 0), (0, 30), (40, 30), (40, 0), (0, 0)]),
+        ])
+        store = PolygonStore(rings.coords, rings.ring_offsets, [0, 0, 0], ['a'])
+        matches, parts, windows, _ = classify_matches([store], 0.6, 0.03)
+        actual = list(boxlike_rows(matches, parts, windows))
+        self.assertEqual([('a', 0), ('a', 2)], [row[:2] for row in actual])
+        for row in actual:
+            self.assertAlmostEqual(0, row[2])
+            self.assertAlmostEqual(math.pi / 2, row[4])
+            self.assertAlmostEqual(math.pi / 2, row[6])
+        self.assertEqual(20, actual[0][5])
@@ -0,0 +1,60 @@
+import unittest
+
+
+class TestNeighborIndex(unittest.TestCase):
+
+    def test_query(self):
+        import numpy as np
+        from shapeanalysis.neighbors import NeighborIndex
+
+        index = NeighborIndex([(0, 0), (0, 1), (3, 0), (0, 2.5)])
+        distances, neighbors = index.query([(0, 0.9), (10, 0)], 2)
+        self.assertTrue(np.allclose([(0.1, 0.9), (7, 10)], distances))
+        self.assertEqual([[1, 0], [2, 0]], neighbors.tolist())
+
+    def test_query_matches_nearest_distances(self):
+        import numpy as np
+        from shapeanalysis.neighbors import NeighborIndex
+        from shapeanalysis.process_data import nearest_distances
+
+        points = np.random.default_rng(7).random((300, 2))
+        points[10] = points[11]
+        expected, _ = nearest_distances(points, 3)
+        index = NeighborIndex(points, range(len(points)))
+        for num_nearest in (1, 3):
+            actual, _ = index.query(points, num_nearest, range(len(points)))
+            self.assertTrue(np.array_equal(expected[:, :num_nearest], actual))
+
+    def test_query_excludes_ids(self):
+        from shapeanalysis.neighbors import NeighborIndex
+
+        index = NeighborIndex([(0, 0), (1, 0), (2, 0), (5, 0)], ['a', 'a', 'a', 'b'])
+        distances, neighbors = index.query([(0.5, 0), (5, 1)], 1, ['a', 'b'])
+        self.assertEqual([[4.5], [10 ** 0.5]], distances.tolist())
+        self.assertEqual([[3], [2]], neighbors.tolist())
+
+        distances, neighbors = index.query([(0.5, 0)], 2, ['a'])
+        self.assertEqual([[4.5, float('inf')]], distances.tolist())
+        self.assertEqual([[3, 4]], neighbors.tolist())
+
+    def test_query_max_distance(self):
+        import numpy as np
+        from shapeanalysis.neighbors import NeighborIndex
+
+        index = NeighborIndex([(0, 0), (1, 0), (4, 0)])
+        distances, neighbors = index.query([(0, 0)], 3, max_distance=2)
+        self.assertEqual([[0, 1, np.inf]], distances.tolist())
+        self.assertEqual([[0, 1, 3]], neighbors.tolist())
+
+
+class TestReferenceCollector(unittest.TestCase):
+
+    def test_collect(self):
+        from shapeanalysis.neighbors import ReferenceCollector
+        from shapeanalysis.store import PolygonStore
+
+        store = PolygonStore.from_rings([(7, [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])])
+        collector = ReferenceCollector()
+        self.assertEqual([store], list(collector.collect([store])))
+        self.assertEqual([7], collector.pids)
+        self.assertEqual([1, 1], collector.points[0].tolist())
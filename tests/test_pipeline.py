@@ -0,0 +1,172 @@
+import unittest
+
+
+def make_stores():
+    """Helper to build stores of boxes, triangles and parallelograms"""
+    from shapeanalysis.store import PolygonStore
+    rings = []
+    for i in range(30):
+        x = 100 * i
+        if i % 3 == 0:
+            ring = [(x, 0), (x, 20), (x + 10, 20), (x + 20, 10), (x + 20, 0), (x, 0)]
+        elif i % 3 == 1:
+            ring = [(x, 0), (x + 15, 0), (x, 15), (x, 0)]
+        else:
+            ring = [(x, 1), (x + 15, 0), (x + 30, 1), (x + 15, 2), (x, 1)]
+        rings.append((i, ring))
+    return list(PolygonStore.from_rings(rings).chunks(4))
+
+
+class TestClassifyStore(unittest.TestCase):
+
+    def test_classify_store(self):
+        import numpy as np
+        from shapeanalysis.pipeline import classify_store
+        from shapeanalysis.process_data import significant_points
+
+        store = make_stores()[0]
+        actual = classify_store(store, 0.6, 0.03)
+        self.assertEqual([True, False, False, True], [result.has_box for result in actual])
+        self.assertTrue(np.array_equal(significant_points(store.ring(3), 0.6), actual[3].sig_points))
+        self.assertIsNone(actual[1].sig_points)
+
+    def test_classify_store_prefiltered(self):
+        from shapeanalysis.pipeline import classify_store
+        from shapeanalysis.store import PolygonStore
+
+        store = PolygonStore.from_rings([(1, [(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)])])
+        actual = classify_store(store, 0.6, 0.03)
+        self.assertEqual('extent', actual[0].rejected)
+
+
+class TestClassifyMatches(unittest.TestCase):
+
+    def test_classify_matches(self):
+        import numpy as np
+        from shapeanalysis.pipeline import classify_matches
+        from shapeanalysis.process_data import find_box
+
+        actual, _, windows, _ = classify_matches(make_stores(), 0.6, 0.03)
+        self.assertEqual([find_box(points, 0.03) for points in actual.rings()], windows.tolist())
+        self.assertEqual(np.int64, windows.dtype)
+        self.assertEqual(list(range(0, 30, 3)), list(actual.ring_pids))
+
+    def test_classify_matches_parts(self):
+        from shapeanalysis.pipeline import classify_matches
+        from shapeanalysis.store import PolygonStore
+
+        # An L-shaped ring and a rectangle of one record
+        rings = PolygonStore.from_rings([
+            (7, [(0, 0), (0, 60), (20, 60), (20, 20), (60, 20), (60, 0), (0, 0)]),
+            (7, [(100, 0), (100, 20), (130, 20), (130, 0), (100, 0)]),
+        ])
+        store = PolygonStore(rings.coords, rings.ring_offsets, [0, 0], [7])
+        rectangles = []
+        matches, parts, _, _ = classify_matches([store], 0.6, 0.03, on_rectangles=rectangles.extend)
+        self.assertEqual([(7, 0), (7, 1)], list(zip(matches.ring_pids, parts.tolist())))
+        self.assertEqual([(7, 1, 600)], [(row[0], row[1], round(row[-1])) for row in rectangles])
+
+    def test_classify_matches_ring_centroids(self):
+        import numpy as np
+        from shapeanalysis.pipeline import classify_matches
+        from shapeanalysis.rings import ring_centroids
+        from shapeanalysis.store import PolygonStore
+
+        store = PolygonStore.concatenate(make_stores())
+        for method in ('vertex', 'area'):
+            matches, _, _, actual = classify_matches(make_stores(), 0.6, 0.03, centroid=method)
+            expected = ring_centroids(store.filter(store.ring_pids % 3 == 0), method)
+            self.assertEqual((len(matches), 2), actual.shape)
+            self.assertTrue(np.allclose(expected, actual))
+
+    def test_classify_matches_workers_match_serial(self):
+        import numpy as np
+        from shapeanalysis.pipeline import classify_matches
+
+        expected, _, _, _ = classify_matches(make_stores(), 0.6, 0.03)
+        actual, _, _, _ = classify_matches(make_stores(), 0.6, 0.03, workers=2)
+        self.assertEqual(list(expected.ring_pids), list(actual.ring_pids))
+        self.assertTrue(np.array_equal(expected.coords, actual.coords))
+        self.assertTrue(np.array_equal(expected.ring_offsets, actual.ring_offsets))
+
+    def test_classify_matches_cache(self):
+        import os
+        import shutil
+        import tempfile
+        import numpy as np
+        from shapeanalysis.cache import ClassificationCache
+        from shapeanalysis.pipeline import classify_matches
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'cache.db')
+            expected, _, _, _ = classify_matches(make_stores(), 0.6, 0.03)
+            with ClassificationCache(path) as cache:
+                actual, _, _, _ = classify_matches(make_stores(), 0.6, 0.03, cache=cache)
+                self.assertEqual((0, 30), (cache.hits, cache.misses))
+            with ClassificationCache(path) as cache:
+                cached, _, _, _ = classify_matches(make_stores(), 0.6, 0.03, workers=2, cache=cache)
+                self.assertEqual((30, 0), (cache.hits, cache.misses))
+        finally:
+            shutil.rmtree(tempdir)
+
+        for store in (actual, cached):
+            self.assertEqual(list(expected.ring_pids), list(store.ring_pids))
+            self.assertTrue(np.array_equal(expected.coords, store.coords))
+
+
+class TestSweepChunks(unittest.TestCase):
+
+    def test_sweep_chunks_match_classify_matches(self):
+        import numpy as np
+        from shapeanalysis.pipeline import classify_matches, sweep_chunks
+        from shapeanalysis.store import PolygonStore
+
+        chunks = list(sweep_chunks(make_stores(), [0.6, 1.5], [0.01, 0.03], workers=2))
+        self.assertEqual(len(make_stores()), len(chunks))
+        for chunk in chunks:
+            self.assertEqual([(0.6, 0.01), (0.6, 0.03), (1.5, 0.01), (1.5, 0.03)], list(chunk))
+        for combination in chunks[0]:
+            matches = PolygonStore.concatenate([chunk[combination][0] for chunk in chunks])
+            parts = [part for chunk in chunks for part in chunk[combination][1].tolist()]
+            expected, expected_parts, _, _ = classify_matches(make_stores(), *combination)
+            self.assertEqual(list(expected.ring_pids), list(matches.ring_pids))
+            self.assertEqual(expected_parts.tolist(), parts)
+            self.assertTrue(np.array_equal(expected.coords, matches.coords))
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_prefetch_order(self):
+        from shapeanalysis.pipeline import prefetch
+
+        self.assertEqual(list(range(100)), list(prefetch(iter(range(100)), 2)))
+
+    def test_prefetch_error(self):
+        from shapeanalysis.pipeline import prefetch
+
+        def items():
+            yield 1
+            raise KeyError('bad record')
+
+        actual = prefetch(items())
+        self.assertEqual(1, next(actual))
+        with self.assertRaises(KeyError):
+            next(actual)
+
+    def test_prefetch_stops_producer(self):
+        import itertools
+        from shapeanalysis.pipeline import prefetch
+
+        produced = []
+
+        def items():
+            for i in itertools.count():
+                produced.append(i)
+                yield i
+
+        actual = prefetch(items(), 2)
+        self.assertEqual([0, 1], list(itertools.islice(actual, 2)))
+        actual.close()
+        # The two consumed, at most two queued and one waiting to be
+        self.assertLessEqual(len(produced), 5)
@@ -15,6 +15,35 @@ def assertArrayEquals(testcase, arr1, arr2):
     )
 
 
+def reference_remove_insignificant(point_iter, data_iter, tolerance):
+    """Rescanning implementation remove_insignificant must agree with"""
+    from math import isclose
+    from shapeanalysis.process_data import PointData, less_or_close, neighbor_window
+    data_seq = list(data_iter)
+    sig_points = list(point_iter)
+    while True:
+        rem_values = [x.offset for x in data_seq if x.between and less_or_close(x.offset, tolerance)]
+        if not rem_values:
+            break
+        next_rmv = min(rem_values)
+        for index, data in enumerate(data_seq):
+            if data.between and isclose(data.offset, next_rmv):
+                break
+        del sig_points[index + 1]
+        del data_seq[index]
+        if index == 0:
+            sig_points[-1] = sig_points[1]
+        if index == len(data_seq):
+            sig_points[0] = sig_points[index]
+        if index > 0:
+            data_seq[index - 1] = PointData(*neighbor_window(sig_points, index))
+        if index < len(data_seq):
+            data_seq[index] = PointData(*neighbor_window(sig_points, index + 1))
+        if index == len(data_seq):
+            data_seq[index - 1] = PointData(*neighbor_window(sig_points, index))
+    return sig_points
+
+
 class TestLessOrClose(unittest.TestCase):
 
     def test_less_or_close_simple(self):
@@ -622,6 +651,49 @@ class TestRemoveInsignificant(unittest.TestCase):
         assertArrayEquals(self, expected, actual)
 
 
+class TestRemovalOrder(unittest.TestCase):
+
+    def test_removal_order(self):
+        import numpy as np
+        from shapeanalysis.process_data import removal_order, ring_point_data
+
+        point_seq = np.asarray([
+            (0, 0),
+            (0.5858, 1.414),  # removed second
+            (2, 2),
+            (3.414, 1.414),   # lowest offset, removed first
+            (4, 0),
+            (0, 0),
+            (0.5858, 1.414),
+        ])
+        offsets, betweens = ring_point_data(point_seq)
+        actual = removal_order(point_seq[1:-1].tolist(), offsets.tolist(), betweens.tolist(), 0.6)
+        self.assertEqual([2, 0], [index for index, _ in actual])
+
+    def test_removal_order_tie_removes_first(self):
+        from shapeanalysis.process_data import removal_order
+
+        centers = [(0, 1), (0, 2), (1, 2), (2, 2), (2, 0), (0, 0)]
+        offsets = [0, 1, 0, 1, 1, 1]
+        betweens = [True, False, True, False, False, False]
+        actual = [index for index, _ in removal_order(centers, offsets, betweens, 0.5)]
+        self.assertEqual([0, 2], actual)
+
+    def test_remove_insignificant_large_ring(self):
+        import numpy as np
+        from shapeanalysis.process_data import modified_point_list, point_data_list, remove_insignificant
+
+        rng = np.random.default_rng(1)
+        angles = np.linspace(0, 2 * np.pi, 300, endpoint=False)
+        radii = 100 + rng.normal(0, 0.5, len(angles))
+        pts = np.c_[np.cos(angles) * radii, np.sin(angles) * radii]
+        point_seq = modified_point_list([tuple(p) for p in pts] + [tuple(pts[0])])
+        expected = reference_remove_insignificant(point_seq, point_data_list(point_seq), 1)
+        actual = remove_insignificant(point_seq, point_data_list(point_seq), 1)
+        self.assertEqual(len(expected), len(actual))
+        assertArrayEquals(self, expected, actual)
+
+
 class TestSignificantPoints(unittest.TestCase):
 
     def test_significant_points(self):
@@ -649,6 +721,97 @@ class TestSignificantPoints(unittest.TestCase):
         assertArrayEquals(self, expected, actual)
 
 
+class TestLessOrCloseArray(unittest.TestCase):
+
+    def test_less_or_close_array(self):
+        import numpy as np
+        from shapeanalysis.process_data import less_or_close_array
+
+        actual = less_or_close_array(np.array((0, 1, 1, 1.01 - 1, np.nan)), np.array((1, 0, 1, 0.01, 1)))
+        expected = [True, False, True, True, False]
+        self.assertEqual(expected, list(actual))
+
+
+class TestWrappedRing(unittest.TestCase):
+
+    def test_wrapped_ring_too_small(self):
+        from shapeanalysis.process_data import wrapped_ring
+        with self.assertRaises(ValueError):
+            wrapped_ring([(0, 0), (0, 0)])
+
+    def test_wrapped_ring_verify_start_and_end_same(self):
+        from shapeanalysis.process_data import wrapped_ring
+        with self.assertRaises(ValueError):
+            wrapped_ring([(0, 0), (0, 1), (0, 2)])
+
+    def test_wrapped_ring_verify_each_element_len2(self):
+        from shapeanalysis.process_data import wrapped_ring
+        with self.assertRaises(ValueError):
+            wrapped_ring([(0, 0, 0), (0, 1, 0), (0, 0, 0)])
+
+    def test_wrapped_ring(self):
+        import numpy as np
+        from shapeanalysis.process_data import modified_point_list, wrapped_ring
+
+        points = [(0, 0), (0, 1), (0, 2), (0, 3), (0, 0)]
+        actual = wrapped_ring(points)
+        assertArrayEquals(self, modified_point_list(points), actual)
+        self.assertEqual(np.float64, actual.dtype)
+
+
+class TestRingPointData(unittest.TestCase):
+
+    def test_ring_point_data(self):
+        import numpy as np
+        from shapeanalysis.process_data import point_data_list, ring_point_data
+
+        point_seq = np.asarray([(0, 0), (1, 1), (2, 2), (0, 3), (0, 0), (1, 1)])
+        offset, between = ring_point_data(point_seq)
+        expected = list(point_data_list(point_seq))
+        self.assertTrue(np.allclose([x.offset for x in expected], offset))
+        self.assertEqual([x.between for x in expected], list(between))
+
+    def test_ring_point_data_repeated_point(self):
+        import numpy as np
+        from shapeanalysis.process_data import ring_point_data
+
+        point_seq = np.asarray([(0, 0), (0, 1), (0, 0), (0, 1)])
+        offset, between = ring_point_data(point_seq)
+        self.assertTrue(np.all(np.isnan(offset)))
+        self.assertFalse(np.any(between))
+
+    def test_point_offset_between(self):
+        import numpy as np
+        from shapeanalysis.process_data import point_offset_between, ring_point_data
+
+        point_seq = np.asarray([(0.5, 0.25), (1.75, 1.5), (2, 2.25)])
+        offset, between = ring_point_data(point_seq)
+        self.assertEqual((offset[0], between[0]), point_offset_between(*point_seq.tolist()))
+
+
+class TestSignificantPointsReference(unittest.TestCase):
+
+    def test_significant_points_matches_reference(self):
+        import numpy as np
+        from shapeanalysis.process_data import modified_point_list, point_data_list, significant_points
+
+        rng = np.random.default_rng(0)
+        corners = np.asarray([(0, 0), (0, 20), (30, 20), (30, 0), (0, 0)])
+        for _ in range(100):
+            # Rectangle with noisy extra points along its edges
+            t = np.sort(rng.random(rng.integers(4, 40))) * 4
+            side = t.astype(int)
+            pts = corners[side] + (corners[side + 1] - corners[side]) * (t - side)[:, None]
+            pts = pts + rng.normal(0, 0.3, pts.shape)
+            points = [tuple(p) for p in pts] + [tuple(pts[0])]
+            for tolerance in (0.1, 0.6, 2):
+                point_seq = modified_point_list(points)
+                expected = reference_remove_insignificant(point_seq, point_data_list(point_seq), tolerance)
+                actual = significant_points(points, tolerance)
+                self.assertEqual(len(expected), len(actual))
+                assertArrayEquals(self, expected, actual)
+
+
 class TestOrthogonal(unittest.TestCase):
 
     def test_orthogonal_equal(self):
@@ -702,6 +865,37 @@ class TestOrthogonal(unittest.TestCase):
         self.assertTrue(actual)
 
 
+class TestAnglePredicates(unittest.TestCase):
+
+    def test_orthogonal_vectors_match_get_radians(self):
+        import numpy as np
+        from shapeanalysis.process_data import get_radians, orthogonal_limit, orthogonal_vectors
+
+        windows = np.random.default_rng(7).normal(0, 1, (2000, 3, 2))
+        vec1 = windows[:, 0] - windows[:, 1]
+        vec2 = windows[:, 2] - windows[:, 1]
+        for tolerance in (0.03, 0.5, 1.0, 2.0):
+            actual = orthogonal_vectors(vec1, vec2, orthogonal_limit(tolerance))
+            expected = [abs(get_radians(*window) - np.pi / 2) <= tolerance for window in windows]
+            self.assertEqual(expected, actual.tolist())
+
+    def test_orthogonal_vectors_zero_length(self):
+        import numpy as np
+        from shapeanalysis.process_data import orthogonal_limit, orthogonal_vectors
+
+        actual = orthogonal_vectors(np.array([(0, 0), (0, 1)]), np.array([(1, 0), (1, 0)]), orthogonal_limit(0.1))
+        self.assertEqual([False, True], actual.tolist())
+
+    def test_same_side_vectors(self):
+        import numpy as np
+        from shapeanalysis.process_data import same_side_vectors
+
+        line = np.array([(1, 1), (1, 1), (1, 1), (1, 0)])
+        vec1 = np.array([(1, 0), (0, 1), (1, 0), (0, 1)])
+        vec2 = np.array([(1, 0), (0, 1), (0, 1), (1, 0)])
+        self.assertEqual([True, True, False, False], same_side_vectors(line, vec1, vec2).tolist())
+
+
 class TestSameSide(unittest.TestCase):
 
     def test_same_side_right(self):
@@ -915,6 +1109,179 @@ class TestHasBox(unittest.TestCase):
         self.assertFalse(actual)
 
 
+class TestPrefilterRings(unittest.TestCase):
+
+    def test_prefilter_rings(self):
+        from shapeanalysis.process_data import prefilter_rings
+
+        coords = [
+            (0, 0), (15, 0), (0, 15), (0, 0),         # passes
+            (0, 0), (5, 0), (5, 5), (0, 5), (0, 0),   # extent
+            (0, 0), (1, 0), (0, 0),                   # vertices
+        ]
+        actual = prefilter_rings(coords, [0, 4, 9, 12, 12])
+        self.assertEqual([-1, 1, 0, 0], list(actual))
+
+    def test_prefilter_rings_min_len(self):
+        from shapeanalysis.process_data import prefilter_rings
+
+        coords = [(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)]
+        self.assertEqual([-1], list(prefilter_rings(coords, [0, 5], min_len=5)))
+
+    def test_prefilter_ring(self):
+        from shapeanalysis.process_data import prefilter_ring
+
+        self.assertEqual('extent', prefilter_ring([(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)]))
+        self.assertIsNone(prefilter_ring([(0, 0), (0, 20), (20, 20), (0, 0)]))
+
+    def test_prefilter_never_rejects_a_box(self):
+        import numpy as np
+        from shapeanalysis.process_data import find_box, prefilter_ring, significant_points
+
+        rng = np.random.default_rng(2)
+        for _ in range(300):
+            # Random rectangles around the min_len boundary
+            width, height = rng.uniform(3, 15, 2)
+            points = [(0, 0), (0, height), (width, height), (width, 0), (0, 0)]
+            if find_box(significant_points(points, 0.6), 0.03) is not None:
+                self.assertIsNone(prefilter_ring(points))
+
+
+class TestFindBox(unittest.TestCase):
+
+    def test_find_box(self):
+        import numpy as np
+        from shapeanalysis.process_data import find_box, significant_points
+
+        sig_points = significant_points([(0, 0), (0, 20), (10, 20), (20, 10), (20, 0), (0, 0)], 0.6)
+        actual = find_box(sig_points, 0.03)
+        self.assertEqual(4, actual)
+        self.assertTrue(np.array_equal([(20, 0), (0, 0)], sig_points[actual:actual + 2]))
+
+    def test_find_box_non_found(self):
+        from shapeanalysis.process_data import find_box, significant_points
+
+        sig_points = significant_points([(0, 1), (15, 0), (30, 1), (15, 2), (0, 1)], 0.6)
+        self.assertIsNone(find_box(sig_points, 0.03))
+
+    def test_find_box_matches_window_loop(self):
+        import numpy as np
+        from shapeanalysis.process_data import (
+            distance,
+            find_box,
+            less_or_close,
+            neighbor_window,
+            orthogonal,
+            same_side,
+            wrapped_ring,
+        )
+
+        def first_window(sig_points, angle_tolerance, min_len=10, max_len=80):
+            for i in range(1, len(sig_points) - 2):
+                p1, p2, p3, p4 = neighbor_window(sig_points, i, count=2)
+                mid_dist = distance(p2, p3)
+                if (orthogonal(p1, p2, p3, angle_tolerance) and
+                        orthogonal(p2, p3, p4, angle_tolerance) and
+                        same_side(p1, p2, p3, p4) and
+                        less_or_close(mid_dist, max_len) and
+                        less_or_close(min_len, mid_dist)):
+                    return i
+            return None
+
+        rng = np.random.default_rng(11)
+        found = 0
+        for _ in range(300):
+            count = rng.integers(4, 30)
+            angles = np.sort(rng.uniform(0, 2 * np.pi, count))
+            radii = rng.uniform(5, 60, count)
+            points = np.round(np.column_stack((radii * np.cos(angles), radii * np.sin(angles))) / 10) * 10
+            points += rng.normal(0, 0.05, points.shape)
+            sig_points = wrapped_ring(np.concatenate((points, points[:1])))
+            for angle_tolerance in (0.01, 0.1):
+                expected = first_window(sig_points, angle_tolerance)
+                self.assertEqual(expected, find_box(sig_points, angle_tolerance))
+                found += expected is not None
+        self.assertGreater(found, 0)
+
+    def test_has_box_precomputed_sig_points(self):
+        from shapeanalysis.process_data import has_box, significant_points
+
+        points = [(0, 0), (15, 0), (15, 15), (0, 15), (0, 0)]
+        sig_points = significant_points(points, 0.6)
+        self.assertTrue(has_box(points, 0.6, 0.03, sig_points=sig_points))
+        self.assertFalse(has_box(points, 0.6, 0.03, sig_points=sig_points[:4]))
+
+
+class TestClassifyRing(unittest.TestCase):
+
+    def test_classify_ring(self):
+        from shapeanalysis.process_data import classify_ring, significant_points
+
+        points = [(0, 0), (0, 20), (10, 20), (20, 10), (20, 0), (0, 0)]
+        actual = classify_ring(points, 0.6, 0.03)
+        assertArrayEquals(self, significant_points(points, 0.6), actual.sig_points)
+        self.assertTrue(actual.has_box)
+        self.assertEqual(4, actual.window)
+
+    def test_classify_ring_non_found(self):
+        from shapeanalysis.process_data import classify_ring
+
+        points = [(0, 0), (15, 0), (0, 15), (0, 0)]
+        actual = classify_ring(points, 0.6, 0.03)
+        self.assertFalse(actual.has_box)
+        self.assertIsNone(actual.window)
+        self.assertIsNone(actual.rejected)
+
+    def test_classify_ring_prefiltered(self):
+        from shapeanalysis.process_data import classify_ring
+
+        points = [(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)]
+        actual = classify_ring(points, 0.6, 0.03)
+        self.assertFalse(actual.has_box)
+        self.assertIsNone(actual.sig_points)
+        self.assertEqual('extent', actual.rejected)
+
+        actual = classify_ring(points, 0.6, 0.03, prefilter=False)
+        self.assertIsNotNone(actual.sig_points)
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_sweep_significant_points(self):
+        import numpy as np
+        from shapeanalysis.process_data import significant_points, sweep_significant_points
+
+        rng = np.random.default_rng(2)
+        angles = np.linspace(0, 2 * np.pi, 200, endpoint=False)
+        radii = 100 + rng.normal(0, 1, len(angles))
+        points = np.c_[np.cos(angles) * radii, np.sin(angles) * radii]
+        points = np.vstack([points, points[:1]])
+        tolerances = [0.2, 0.6, 1, 2.5]
+        actual = sweep_significant_points(points, tolerances)
+        for tolerance, sig_points in zip(tolerances, actual):
+            assertArrayEquals(self, significant_points(points, tolerance), sig_points)
+
+    def test_sweep_ring(self):
+        import itertools
+        from shapeanalysis.process_data import classify_ring, sweep_ring
+
+        points = [(0, 0), (0, 10), (0.5, 20), (0, 30), (10, 30.5), (20, 30), (20.5, 15), (20, 0), (0, 0)]
+        tolerances = [0.1, 0.6]
+        angle_tolerances = [0.01, 0.03]
+        actual = sweep_ring(points, tolerances, angle_tolerances)
+        for (tolerance, angle_tolerance), result in zip(itertools.product(tolerances, angle_tolerances), actual):
+            expected = classify_ring(points, tolerance, angle_tolerance)
+            self.assertEqual(expected.window, result.window)
+            assertArrayEquals(self, expected.sig_points, result.sig_points)
+        self.assertEqual([False, False, True, True], [result.has_box for result in actual])
+
+    def test_sweep_ring_prefiltered(self):
+        from shapeanalysis.process_data import sweep_ring
+
+        actual = sweep_ring([(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)], [0.6, 1], [0.03])
+        self.assertEqual(['extent', 'extent'], [result.rejected for result in actual])
+
+
 class TestDistance(unittest.TestCase):
 
     def test_distance1(self):
@@ -1078,16 +1445,6 @@ class TestSplitList(unittest.TestCase):
 
 class TestNearestDistances(unittest.TestCase):
 
-    def assertDictArrayValuesEqual(self, expected, actual):
-        import numpy as np
-        try:
-            if set(expected.keys()) == set(actual.keys()):
-                for x in expected.keys():
-                    if not np.allclose(expected[x], actual[x]):
-                        raise AssertionError(f'{expected[x]} != {actual[x]}')
-        except AttributeError:
-            raise AssertionError('dictionary keys do not match')
-
     def test_nearest_distances_1_nearest(self):
         import numpy as np
         from shapeanalysis.process_data import nearest_distances
@@ -1099,15 +1456,9 @@ class TestNearestDistances(unittest.TestCase):
             np.asarray((0, 2.5)),
         ]
 
-        actual = nearest_distances(points, num_nearest=1)
-        expected = {
-            np.array((0, 0), dtype=np.float).tobytes(): np.array((1,), dtype=np.float),
-            np.array((0, 1), dtype=np.float).tobytes(): np.array((1,), dtype=np.float),
-            np.array((3, 0), dtype=np.float).tobytes(): np.array((3,), dtype=np.float),
-            np.array((0, 2.5), dtype=np.float).tobytes(): np.array((1.5,), dtype=np.float),
-        }
-
-        self.assertDictArrayValuesEqual(expected, actual)
+        distances, neighbors = nearest_distances(points)
+        self.assertTrue(np.allclose([[1], [1], [3], [1.5]], distances))
+        self.assertEqual([[1], [0], [0], [1]], neighbors.tolist())
 
     def test_nearest_distances_2_nearest(self):
         import numpy as np
@@ -1120,16 +1471,47 @@ class TestNearestDistances(unittest.TestCase):
             np.asarray((0, 2.5)),
         ]
 
-        actual = nearest_distances(points, num_nearest=2)
-        expected = {
-            np.array((0, 0), dtype=np.float).tobytes(): np.array((1, 2.5), dtype=np.float),
-            np.array((0, 1), dtype=np.float).tobytes(): np.array((1, 1.5), dtype=np.float),
-            np.array((3, 0), dtype=np.float).tobytes(): np.array((3, 3.16227766), dtype=np.float),
-            np.array((0, 2.5), dtype=np.float).tobytes(): np.array((1.5, 2.5), dtype=np.float),
-        }
+        distances, neighbors = nearest_distances(points, num_nearest=2)
+        expected = [(1, 2.5), (1, 1.5), (3, 3.16227766), (1.5, 2.5)]
+        self.assertTrue(np.allclose(expected, distances))
+        self.assertEqual([[1, 3], [0, 3], [0, 1], [1, 0]], neighbors.tolist())
 
-        self.assertDictArrayValuesEqual(expected, actual)
-        self.assertTrue(actual)
+    def test_nearest_distances_duplicates(self):
+        import numpy as np
+        from shapeanalysis.process_data import nearest_distances
+
+        points = [(0, 0), (0, 0), (0, 0), (5, 0)]
+        distances, neighbors = nearest_distances(points, num_nearest=1)
+        self.assertEqual([[0], [0], [0], [5]], distances.tolist())
+        for index, neighbor in enumerate(neighbors[:3, 0]):
+            self.assertNotEqual(index, neighbor)
+            self.assertIn(neighbor, (0, 1, 2))
+
+    def test_nearest_distances_indexes(self):
+        import numpy as np
+        from shapeanalysis.process_data import nearest_distances
+
+        points = [(0, 0), (0, 1), (3, 0), (0, 2.5)]
+        distances, neighbors = nearest_distances(points, 2, indexes=[3, 0])
+        self.assertTrue(np.allclose([(1.5, 2.5), (1, 2.5)], distances))
+        self.assertEqual([[1, 0], [1, 3]], neighbors.tolist())
+
+    def test_nearest_distances_too_few_points(self):
+        import numpy as np
+        from shapeanalysis.process_data import nearest_distances
+
+        distances, neighbors = nearest_distances([(0, 0), (1, 0)], num_nearest=2)
+        self.assertEqual([[1, np.inf], [1, np.inf]], distances.tolist())
+        self.assertEqual([[1, 2], [0, 2]], neighbors.tolist())
+
+        distances, neighbors = nearest_distances([], num_nearest=2)
+        self.assertEqual((0, 2), distances.shape)
+
+    def test_nearest_distances_num_nearest(self):
+        from shapeanalysis.process_data import nearest_distances
+
+        with self.assertRaises(ValueError):
+            nearest_distances([(0, 0), (1, 0)], num_nearest=0)
 
 
 class TestGetPointIndexByValue(unittest.TestCase):
@@ -0,0 +1,75 @@
+import unittest
+
+
+def make_store():
+    """Helper to build a store of a box, an L, the L's significant points,
+    an empty ring and a single point"""
+    from shapeanalysis.process_data import significant_points
+    from shapeanalysis.store import PolygonStore
+
+    box = [(0, 0), (4, 0), (4, 2), (0, 2), (0, 0)]
+    ell = [(0, 0), (4, 0), (4, 1), (1, 1), (1, 3), (0, 3), (0, 0)]
+    return PolygonStore.from_rings([
+        ('a', box),
+        ('b', ell),
+        ('c', significant_points(ell, 0.1)),
+        ('d', []),
+        ('e', [(1, 1)]),
+    ])
+
+
+class TestRingVertexCentroids(unittest.TestCase):
+
+    def test_matches_centroid(self):
+        import numpy as np
+        from shapeanalysis.process_data import centroid
+        from shapeanalysis.rings import ring_vertex_centroids
+
+        store = make_store()
+        actual = ring_vertex_centroids(store.coords, store.ring_offsets)
+        for index in (0, 1, 2):
+            self.assertTrue(np.allclose(centroid(store.ring(index)), actual[index]))
+        self.assertTrue(np.all(np.isnan(actual[3:])))
+
+
+class TestRingAreas(unittest.TestCase):
+
+    def test_signed_areas(self):
+        from shapeanalysis.rings import ring_signed_areas
+        from shapeanalysis.store import PolygonStore
+
+        store = make_store()
+        self.assertEqual([8, 6, 6, 0, 0], ring_signed_areas(store.coords, store.ring_offsets).tolist())
+        clockwise = PolygonStore.from_rings([('a', [(0, 0), (0, 2), (4, 2), (4, 0)])])
+        self.assertEqual([-8], ring_signed_areas(clockwise.coords, clockwise.ring_offsets).tolist())
+
+    def test_area_centroids(self):
+        import numpy as np
+        from shapeanalysis.rings import ring_area_centroids
+
+        store = make_store()
+        actual = ring_area_centroids(store.coords, store.ring_offsets)
+        self.assertTrue(np.allclose([(2, 1), (1.5, 1), (1.5, 1)], actual[:3]))
+        self.assertTrue(np.all(np.isnan(actual[3:])))
+
+    def test_area_centroids_far_from_origin(self):
+        from shapeanalysis.rings import ring_area_centroids
+        from shapeanalysis.store import PolygonStore
+
+        offset = 3e6
+        store = PolygonStore.from_rings([('a', [(offset, offset), (offset + 0.4, offset), (offset, offset + 0.3)])])
+        actual = ring_area_centroids(store.coords, store.ring_offsets)[0]
+        self.assertAlmostEqual(0.4 / 3, actual[0] - offset, places=6)
+        self.assertAlmostEqual(0.1, actual[1] - offset, places=6)
+
+
+class TestRingCentroids(unittest.TestCase):
+
+    def test_ring_centroids(self):
+        from shapeanalysis.rings import ring_centroids
+
+        store = make_store()
+        self.assertEqual([2, 1], ring_centroids(store)[0].tolist())
+        self.assertEqual([1.5, 1], ring_centroids(store, 'area')[1].tolist())
+        with self.assertRaises(ValueError):
+            ring_centroids(store, 'median')
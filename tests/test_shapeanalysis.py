@@ -0,0 +1,87 @@
+import unittest
+
+
+class TestParseArguments(unittest.TestCase):
+
+    def test_parse_arguments_defaults(self):
+        from shapeanalysis import parse_arguments
+
+        actual = parse_arguments(['parcels.shp', 'output.db'])
+        self.assertEqual('parcels.shp', actual.shapefile)
+        self.assertEqual('output.db', actual.output)
+        self.assertEqual(0.6, actual.inline_tolerance)
+        self.assertEqual(0.03, actual.angle_tolerance)
+        self.assertEqual(1, actual.workers)
+
+    def test_parse_arguments_workers(self):
+        from shapeanalysis import parse_arguments
+
+        actual = parse_arguments(['parcels.shp', 'output.db', '--workers', '4', '--chunk-size', '50'])
+        self.assertEqual(4, actual.workers)
+        self.assertEqual(50, actual.chunk_size)
+        for option in ('--workers', '--chunk-size'):
+            with self.assertRaises(SystemExit):
+                parse_arguments(['parcels.shp', 'output.db', option, '0'])
+
+    def test_parse_arguments_selection(self):
+        from shapeanalysis import parse_arguments
+
+        actual = parse_arguments(['parcels.shp', 'output.db', '--offset', '10', '--limit', '20', '--sample-fraction', '0.5'])
+        self.assertEqual(10, actual.offset)
+        self.assertEqual(20, actual.limit)
+        self.assertEqual(0.5, actual.sample_fraction)
+        for option, value in (('--offset', '-3'), ('--limit', '-1'), ('--sample-fraction', '0'), ('--sample-fraction', '1.5')):
+            with self.assertRaises(SystemExit):
+                parse_arguments(['parcels.shp', 'output.db', option, value])
+
+    def test_parse_arguments_incremental(self):
+        from shapeanalysis import parse_arguments
+
+        actual = parse_arguments(['parcels.shp', 'output.db', '--incremental', 'previous.db'])
+        self.assertEqual('previous.db', actual.incremental)
+        with self.assertRaises(SystemExit):
+            parse_arguments(['parcels.shp', 'output.db', '--incremental', 'previous.db', '--limit', '10'])
+
+    def test_parse_arguments_sweep(self):
+        from shapeanalysis import parse_arguments
+
+        actual = parse_arguments(['parcels.shp', 'output.db', '--sweep', '0.4,0.6', '0.03'])
+        self.assertEqual([[0.4, 0.6], [0.03]], actual.sweep)
+        with self.assertRaises(SystemExit):
+            parse_arguments(['parcels.shp', 'output.db', '--sweep', '0.4,x', '0.03'])
+
+    def test_parse_arguments_neighbors(self):
+        from shapeanalysis import parse_arguments
+
+        actual = parse_arguments(['parcels.shp', 'output.db'])
+        self.assertEqual((2, 'matched'), (actual.num_nearest, actual.reference))
+        actual = parse_arguments(['parcels.shp', 'output.db', '-k', '4', '--reference', 'all', '--max-distance', '500'])
+        self.assertEqual((4, 'all', 500), (actual.num_nearest, actual.reference, actual.max_distance))
+        with self.assertRaises(SystemExit):
+            parse_arguments(['parcels.shp', 'output.db', '--incremental', 'previous.db', '--reference', 'all'])
+
+    def test_parse_arguments_distance(self):
+        from shapeanalysis import parse_arguments
+
+        self.assertEqual('centroid', parse_arguments(['parcels.shp', 'output.db']).distance)
+        self.assertEqual('edge', parse_arguments(['parcels.shp', 'output.db', '--distance', 'edge']).distance)
+        with self.assertRaises(SystemExit):
+            parse_arguments(['parcels.shp', 'output.db', '--incremental', 'previous.db', '--distance', 'edge'])
+
+    def test_parse_arguments_append(self):
+        from shapeanalysis import parse_arguments, run_parameters
+
+        actual = parse_arguments(['parcels.shp', 'output.db', '--append', '--run', 'county a'])
+        self.assertEqual((True, 'county a'), (actual.append, actual.run))
+        self.assertNotIn('output', run_parameters(actual))
+        self.assertEqual(0.6, run_parameters(actual)['inline_tolerance'])
+        with self.assertRaises(SystemExit):
+            parse_arguments(['parcels.shp', 'output.db', '--incremental', 'previous.db', '--append'])
+
+    def test_parse_arguments_centroid(self):
+        from shapeanalysis import parse_arguments
+
+        self.assertEqual('vertex', parse_arguments(['parcels.shp', 'output.db']).centroid)
+        self.assertEqual('area', parse_arguments(['parcels.shp', 'output.db', '--centroid', 'area']).centroid)
+        with self.assertRaises(SystemExit):
+            parse_arguments(['parcels.shp', 'output.db', '--centroid', 'median'])
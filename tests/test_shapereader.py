@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestRaggedIndexes(unittest.TestCase):
+
+    def test_ragged_indexes(self):
+        import numpy as np
+        from shapeanalysis.shapereader import ragged_indexes
+
+        actual = ragged_indexes([5, 0, 10], [2, 0, 3])
+        expected = np.array((5, 6, 10, 11, 12))
+        self.assertTrue(np.array_equal(expected, actual))
+
+
+class TestGeometryReader(unittest.TestCase):
+
+    def setUp(self):
+        import shapefile
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'parcels')
+        self.shapes = [
+            [[(0, 0), (0, 20), (10, 20), (20, 10), (20, 0), (0, 0)]],
+            None,
+            [
+                [(30, 0), (30, 20), (50, 20), (50, 0), (30, 0)],
+                [(35.5, 5), (45, 5), (45, 15.25), (35.5, 15.25), (35.5, 5)],
+            ],
+            [[(0.5858, 1.414), (2, 2), (3.414, 1.414), (4, 0), (0, 0), (0.5858, 1.414)]],
+        ]
+        with shapefile.Writer(self.path, shapeType=shapefile.POLYGON) as w:
+            w.field('PID', 'N')
+            for pid, rings in enumerate(self.shapes):
+                if rings is None:
+                    w.null()
+                else:
+                    w.poly(rings)
+                w.record(pid)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_points(self):
+        import numpy as np
+        import shapefile
+        from shapeanalysis.shapereader import GeometryReader
+
+        reader = GeometryReader(self.path + '.shp')
+        with shapefile.Reader(self.path) as sf:
+            for i, shape in enumerate(sf.iterShapes()):
+                self.assertTrue(np.array_equal(np.asarray(shape.points).reshape(-1, 2), reader.points(i)))
+                self.assertEqual(list(shape.parts), list(reader.parts(i)))
+        self.assertEqual(len(self.shapes), len(reader))
+
+    def test_read(self):
+        import numpy as np
+        from shapeanalysis.shapereader import GeometryReader
+
+        coords, record_offsets, part_offsets = GeometryReader(self.path).read()
+        rings = [ring for rings in self.shapes if rings for ring in rings]
+
+        self.assertEqual((sum(len(ring) for ring in rings), 2), coords.shape)
+        self.assertEqual(coords.dtype, np.float64)
+        self.assertEqual([0, 1, 1, 3, 4], list(record_offsets))
+        for i, ring in enumerate(rings):
+            self.assertTrue(np.array_equal(np.asarray(ring), coords[part_offsets[i]:part_offsets[i + 1]]))
+
+    def test_read_records(self):
+        import numpy as np
+        from shapeanalysis.shapereader import GeometryReader
+
+        coords, record_offsets, part_offsets = GeometryReader(self.path).read([3, 0])
+        self.assertEqual([0, 1, 2], list(record_offsets))
+        self.assertTrue(np.array_equal(np.asarray(self.shapes[3][0]), coords[:part_offsets[1]]))
+        self.assertTrue(np.array_equal(np.asarray(self.shapes[0][0]), coords[part_offsets[1]:]))
+
+    def test_bboxes(self):
+        import numpy as np
+        from shapeanalysis.shapereader import GeometryReader
+
+        actual = GeometryReader(self.path).bboxes()
+        self.assertTrue(np.array_equal((0, 0, 20, 20), actual[0]))
+        self.assertTrue(np.all(np.isnan(actual[1])))
+        self.assertTrue(np.array_equal((30, 0, 50, 20), actual[2]))
+
+    def test_slices_feed_downstream_functions(self):
+        import numpy as np
+        from shapeanalysis.process_data import significant_points, has_box, centroid
+        from shapeanalysis.shapereader import GeometryReader
+
+        reader = GeometryReader(self.path)
+        points = reader.points(0)
+        self.assertTrue(has_box(points, 0.6, 0.03))
+        expected = centroid(significant_points(self.shapes[0][0], 0.6))
+        self.assertTrue(np.allclose(expected, centroid(significant_points(points, 0.6))))
+
+        coords, _, part_offsets = reader.read()
+        points = coords[part_offsets[-2]:part_offsets[-1]]
+        self.assertFalse(has_box(points, 0.6, 0.03))
+
+    def test_trailing_null_shape(self):
+        import numpy as np
+        import shapefile
+        from shapeanalysis.shapereader import GeometryReader
+
+        path = os.path.join(self.tempdir, 'trailing')
+        with shapefile.Writer(path, shapeType=shapefile.POLYGON) as w:
+            w.field('PID', 'N')
+            w.poly(self.shapes[0])
+            w.record(0)
+            w.null()
+            w.record(1)
+
+        reader = GeometryReader(path)
+        self.assertEqual([1, 0], list(reader.num_parts))
+        self.assertEqual([6, 0], list(reader.num_points))
+        bboxes = reader.bboxes()
+        self.assertTrue(np.array_equal((0, 0, 20, 20), bboxes[0]))
+        self.assertTrue(np.all(np.isnan(bboxes[1])))
+        _, record_offsets, _ = reader.read()
+        self.assertEqual([0, 1, 1], list(record_offsets))
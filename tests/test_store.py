@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def make_store():
+    """Helper to build a store of three rings over two records"""
+    from shapeanalysis.store import PolygonStore
+    return PolygonStore.from_rings([
+        (1, [(0, 0), (0, 20), (20, 20), (20, 0), (0, 0)]),
+        (2, [(30, 0), (30, 20), (50, 20), (30, 0)]),
+        (2, [(35, 5), (45, 5), (45, 15), (35, 15), (35, 5)]),
+    ])
+
+
+class TestPolygonStore(unittest.TestCase):
+
+    def test_from_rings(self):
+        import numpy as np
+
+        store = make_store()
+        self.assertEqual(3, len(store))
+        self.assertEqual((14, 2), store.coords.shape)
+        self.assertEqual([0, 5, 9, 14], list(store.ring_offsets))
+        self.assertEqual([1, 2, 2], list(store.ring_pids))
+        self.assertTrue(np.array_equal([(30, 0), (30, 20), (50, 20), (30, 0)], store.ring(1)))
+
+    def test_iter(self):
+        store = make_store()
+        actual = [(pid, len(points)) for pid, points in store]
+        expected = [(1, 5), (2, 4), (2, 5)]
+        self.assertEqual(expected, actual)
+
+    def test_slice_is_view(self):
+        import numpy as np
+
+        store = make_store()
+        actual = store[1:]
+        self.assertEqual(2, len(actual))
+        self.assertEqual([2, 2], list(actual.ring_pids))
+        self.assertTrue(np.shares_memory(store.coords, actual.coords))
+        self.assertTrue(np.array_equal(store.ring(2), actual.ring(1)))
+
+    def test_filter(self):
+        import numpy as np
+
+        store = make_store()
+        actual = store.filter(np.array((True, False, True)))
+        self.assertEqual([0, 5, 10], list(actual.ring_offsets))
+        self.assertEqual([1, 2], list(actual.ring_pids))
+        self.assertTrue(np.array_equal(store.ring(2), actual.ring(1)))
+
+    def test_ring_parts(self):
+        from shapeanalysis.store import PolygonStore
+
+        store = make_store()
+        store = PolygonStore(store.coords, store.ring_offsets, [0, 1, 1], [1, 2])
+        self.assertEqual([0, 0, 1], list(store.ring_parts))
+        self.assertEqual([0, 1], list(store[1:].ring_parts))
+        self.assertEqual([], list(store[:0].ring_parts))
+
+    def test_chunks(self):
+        store = make_store()
+        actual = [len(chunk) for chunk in store.chunks(2)]
+        self.assertEqual([2, 1], actual)
+
+    def test_concatenate(self):
+        import numpy as np
+        from shapeanalysis.store import PolygonStore
+
+        store = make_store()
+        actual = PolygonStore.concatenate([store[:1], store[1:]])
+        self.assertEqual([1, 2, 2], list(actual.ring_pids))
+        self.assertTrue(np.array_equal(store.coords, actual.coords))
+        self.assertTrue(np.array_equal(store.ring_offsets, actual.ring_offsets))
+
+    def test_concatenate_empty(self):
+        from shapeanalysis.store import PolygonStore
+
+        actual = PolygonStore.concatenate([])
+        self.assertEqual(0, len(actual))
+
+    def test_ring_offsets_mismatch(self):
+        from shapeanalysis.store import PolygonStore
+        with self.assertRaises(ValueError):
+            PolygonStore([(0, 0)], [0, 1], [0, 0], [1])
+
+
+class TestSelectRecords(unittest.TestCase):
+
+    def test_select_records_all(self):
+        from shapeanalysis.store import select_records
+        self.assertEqual([0, 1, 2, 3], list(select_records(4)))
+
+    def test_select_records_offset_limit(self):
+        from shapeanalysis.store import select_records
+        self.assertEqual([3, 4, 5], list(select_records(10, offset=3, limit=3)))
+
+    def test_select_records_sample_fraction(self):
+        from shapeanalysis.store import select_records
+
+        actual = list(select_records(10000, sample_fraction=0.1, seed=1))
+        self.assertEqual(actual, sorted(set(actual)))
+        self.assertTrue(900 < len(actual) < 1100)
+        self.assertEqual(actual, list(select_records(10000, sample_fraction=0.1, seed=1)))
+
+    def test_select_records_is_lazy(self):
+        from shapeanalysis.store import select_records
+
+        actual = select_records(10 ** 12, sample_fraction=0.5, limit=2)
+        self.assertIs(actual, iter(actual))
+        self.assertEqual(2, len(list(actual)))
+
+
+class TestReadStores(unittest.TestCase):
+
+    def setUp(self):
+        import shapefile
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'parcels')
+        with shapefile.Writer(self.path, shapeType=shapefile.POLYGON) as w:
+            w.field('PID', 'C')
+            for i in range(5):
+                w.poly([[(i, 0), (i, 1), (i + 1, 1), (i, 0)]])
+                w.record(f'P{i}')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_read_stores(self):
+        from shapeanalysis.store import read_stores
+
+        stores = list(read_stores(self.path, chunk_size=2))
+        self.assertEqual([2, 2, 1], [len(store) for store in stores])
+        self.assertEqual(['P0', 'P1', 'P2', 'P3', 'P4'], [pid for store in stores for pid in store.ring_pids])
+        self.assertEqual((4, 0), tuple(stores[2].ring(0)[0]))
+
+    def test_read_stores_records(self):
+        from shapeanalysis.store import read_stores
+
+        stores = list(read_stores(self.path, chunk_size=2, records=iter([1, 3, 4])))
+        self.assertEqual(['P1', 'P3', 'P4'], [pid for store in stores for pid in store.ring_pids])
+        self.assertEqual((3, 0), tuple(stores[0].ring(1)[0]))
+
+    def test_pid_type(self):
+        import shapefile
+        from shapeanalysis.store import pid_type
+
+        self.assertEqual('text', pid_type(self.path))
+        path = os.path.join(self.tempdir, 'numeric')
+        with shapefile.Writer(path, shapeType=shapefile.POLYGON) as w:
+            w.field('PID', 'N')
+            w.null()
+            w.record(1)
+        self.assertEqual('integer', pid_type(path))
@@ -0,0 +1,109 @@
+import unittest
+
+
+class TestDropSelf(unittest.TestCase):
+
+    def test_drop_self(self):
+        import numpy as np
+        from shapeanalysis.tiled import drop_self
+
+        distances = np.array([[0, 1, 2], [0, 0, 3]], dtype=np.float64)
+        neighbors = np.array([[0, 4, 5], [2, 3, 6]])
+        actual_distances, actual_neighbors = drop_self(distances, neighbors, [0, 1])
+        self.assertEqual([[1, 2], [0, 0]], actual_distances.tolist())
+        self.assertEqual([[4, 5], [2, 3]], actual_neighbors.tolist())
+
+
+class TestGrid(unittest.TestCase):
+
+    def test_cells(self):
+        import numpy as np
+        from shapeanalysis.tiled import Grid
+
+        points = np.array([(0, 0), (10, 10), (4.9, 5.1)], dtype=np.float64)
+        grid = Grid(points, 4)
+        self.assertEqual((2, 2), (grid.columns, grid.rows))
+        self.assertEqual([0, 3, 2], grid.cells(points).tolist())
+
+    def test_margins(self):
+        import numpy as np
+        from shapeanalysis.tiled import Grid
+
+        grid = Grid(np.array([(0, 0), (30, 30)], dtype=np.float64), 9)
+        actual = grid.margins(np.array([(12, 15)], dtype=np.float64), 1, 1, 0, 1)
+        self.assertAlmostEqual(2, actual[0])
+        actual = grid.margins(np.array([(12, 15)], dtype=np.float64), 0, 2, 0, 2)
+        self.assertEqual(np.inf, actual[0])
+
+
+class TestTiledNearestDistances(unittest.TestCase):
+
+    def assertMatchesSingleTree(self, points, num_nearest, indexes=None):
+        import numpy as np
+        from shapeanalysis.process_data import nearest_distances
+        from shapeanalysis.tiled import query_bytes, tiled_nearest_distances
+
+        expected, _ = nearest_distances(points, num_nearest, indexes)
+        # Budget for tiles of about 20 points
+        budget = query_bytes(9 * 20, num_nearest)
+        actual, neighbors = tiled_nearest_distances(points, num_nearest, indexes, budget)
+        self.assertTrue(np.array_equal(expected, actual))
+        rows = np.arange(len(points)) if indexes is None else np.asarray(indexes)
+        found = np.linalg.norm(points[neighbors] - points[rows][:, None], axis=2)
+        self.assertTrue(np.array_equal(expected, found))
+
+    def test_uniform(self):
+        import numpy as np
+
+        points = np.random.default_rng(3).random((2000, 2)) * 1000
+        self.assertMatchesSingleTree(points, 2)
+
+    def test_clustered(self):
+        import numpy as np
+
+        rng = np.random.default_rng(4)
+        points = np.concatenate([
+            rng.normal(0, 1, (500, 2)),
+            rng.normal(500, 1, (500, 2)),
+            [(250, 250)],
+            np.zeros((5, 2)),
+        ])
+        self.assertMatchesSingleTree(points, 3)
+
+    def test_indexes(self):
+        import numpy as np
+
+        points = np.random.default_rng(5).random((500, 2))
+        self.assertMatchesSingleTree(points, 1, [499, 3, 250, 3])
+
+    def test_max_distance(self):
+        import numpy as np
+        from shapeanalysis.process_data import nearest_distances
+        from shapeanalysis.tiled import query_bytes, tiled_nearest_distances
+
+        points = np.random.default_rng(8).random((1000, 2)) * 100
+        expected, _ = nearest_distances(points, 3, max_distance=2)
+        self.assertTrue(np.any(np.isinf(expected)))
+        actual, _ = tiled_nearest_distances(points, 3, memory_budget=query_bytes(9 * 20, 3), max_distance=2)
+        self.assertTrue(np.array_equal(expected, actual))
+
+    def test_few_points(self):
+        import numpy as np
+        from shapeanalysis.tiled import tiled_nearest_distances
+
+        distances, neighbors = tiled_nearest_distances(np.array([(0, 0), (3, 4)]), 2, memory_budget=1)
+        self.assertEqual([[5, np.inf], [5, np.inf]], distances.tolist())
+        self.assertEqual([[1, 2], [0, 2]], neighbors.tolist())
+
+        distances, _ = tiled_nearest_distances(np.empty((0, 2)), 2, memory_budget=1)
+        self.assertEqual((0, 2), distances.shape)
+
+    def test_nearest_distances_budget(self):
+        import numpy as np
+        from shapeanalysis.process_data import nearest_distances
+
+        points = np.random.default_rng(6).random((300, 2))
+        expected, _ = nearest_distances(points, 2)
+        actual, _ = nearest_distances(points, 2, memory_budget=10000)
+        self.assertIsInstance(actual, np.memmap)
+        self.assertTrue(np.array_equal(expected, actual))